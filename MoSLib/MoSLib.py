@@ -2,37 +2,45 @@ import cv2
 import numpy as np
 from numpy import ndarray
 from math import tan, radians
-from .utils import math_utils
+from .utils import math_utils, visual_utils
+from .features import default_orb_matcher
+from .depth_engine import default_depth_engine, disparity_to_depth
+from .utils.profiling_utils import profile
 
 
-def ORB_detector(img1: cv2.Mat | ndarray, img2: cv2.Mat | ndarray, nfeatures: int=1000, debug: bool=False):
-
-    orb = cv2.ORB_create(nfeatures=nfeatures)
+def ORB_detector(img1: cv2.Mat | ndarray, img2: cv2.Mat | ndarray, nfeatures: int=1000, debug: bool=False, rectified: bool=False) -> tuple[ndarray, ndarray]:
+    """
+    Detects and matches ORB features of two images with Hamming distance and the ratio test.\n
+    Use `ORBMatcher` directly to reuse the features of a frame across several matches.
 
-    kp1, des1 = orb.detectAndCompute(img1, None)
-    kp2, des2 = orb.detectAndCompute(img2, None)
+    ### Parameters
+        `img1: cv2.Mat | ndarray`:
+            First Image/Frame.
+        `img2: cv2.Mat | ndarray`:
+            Second Image/Frame.
+        `nfeatures: int`:
+            Maximum number of features to detect per image.
+        `debug: bool`:
+            Draw the matched points on the images.
+        `rectified: bool`:
+            Images are a rectified left and right pair. Features are matched only along their rows
+            with `ORBMatcher.match_rectified`, which is faster and drops most false matches.
 
-    bruteForceMatcher = cv2.BFMatcher()
-    matches = bruteForceMatcher.knnMatch(des1, des2, k=2)
+    ### Returns
+        Matched Nx2 float32 points of the first and second image.
+    """
 
-    goodMatches = []
+    matcher = default_orb_matcher(nfeatures)
 
-    for m1, m2 in matches:
-        if m1.distance < 0.75 * m2.distance:
-            goodMatches.append([m1])
-    
-    match_pts = []
+    if rectified:
+        pts1, pts2, _ = matcher.match_rectified(matcher.detect(img1), matcher.detect(img2))
+    else:
+        pts1, pts2 = matcher.match(matcher.detect(img1), matcher.detect(img2))
 
-    for match in goodMatches: # TODO: Make another function for drawing debug things
-        p1 = kp1[match[0].queryIdx].pt
-        p2 = kp2[match[0].queryIdx].pt
-        match_pts.append((p1, p2))
-        cv2.circle(img1, (int(p1[0]), int(p1[1])), 8, (255, 0, 255), cv2.FILLED)
-        cv2.circle(img2, (int(p2[0]), int(p2[1])), 8, (255, 0, 255), cv2.FILLED)
+    if debug:
+        visual_utils.draw_match_points(img1, img2, pts1, pts2)
 
-        #matches = cv2.drawMatchesKnn(img1, kp1, img2, kp2, goodMatches, None, flags=2)
-    #goodMatches, matches
-    return match_pts
+    return pts1, pts2
 
 def focal_length(self, widthInCm: float, distanceFromCam: float, widthInPixels: int) -> float:
     """
@@ -102,44 +110,122 @@ def perspective_projection(rcam_pt: tuple[int, int], lcam_pt: tuple[int, int], h
 
     return x, y, z
 
+def reprojection_matrix(home_point: tuple[int, int], fl: float, c2c_distance: float) -> ndarray:
+    """
+    Builds the 4x4 disparity-to-depth matrix `Q` of an ideal rectified pair. Use the `Q` from stereo\n
+    calibration instead if you have one.
+
+    ### Parameters
+        `home_point: tuple[int, int]`:
+            Principal point of the left camera, usually the frame center.
+        `fl: float`:
+            Focal length in pixels.
+        `c2c_distance: float`:
+            Distance between two camera.
+
+    ### Returns
+        Q matrix. Gives the same result with `perspective_projection`.
+    """
+    return np.array([[1, 0, 0, -home_point[0]],
+                     [0, 1, 0, -home_point[1]],
+                     [0, 0, 0, fl],
+                     [0, 0, 1 / c2c_distance, 0]], np.float64)
+
+def triangulate_points(lcam_pts: ndarray, rcam_pts: ndarray, Q: ndarray) -> tuple[ndarray, ndarray]:
+    """
+    Batch version of `perspective_projection`. Triangulates all matches of a rectified pair at once.
+
+    ### Parameters
+        `lcam_pts: ndarray`:
+            Nx2 left image points.
+        `rcam_pts: ndarray`:
+            Nx2 right image points, in the same order with `lcam_pts`.
+        `Q: ndarray`:
+            Disparity-to-depth matrix from stereo calibration or `reprojection_matrix`.
+
+    ### Returns
+        Nx3 float32 points and the N sized valid mask. Points with zero or negative disparity are NaN.
+    """
+    with profile("triangulation"):
+        lcam_pts = np.asarray(lcam_pts, np.float32).reshape(-1, 2)
+        rcam_pts = np.asarray(rcam_pts, np.float32).reshape(-1, 2)
+
+        pts = np.empty((len(lcam_pts), 4), np.float32)
+        pts[:, :2] = lcam_pts
+        np.subtract(lcam_pts[:, 0], rcam_pts[:, 0], out=pts[:, 2])  # Disparity
+        pts[:, 3] = 1
+
+        homogeneous = pts @ np.asarray(Q, np.float32).T
+        valid = (pts[:, 2] > 0) & (homogeneous[:, 3] != 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            points = homogeneous[:, :3] / homogeneous[:, 3:]
+        points[~valid] = np.nan
+
+    return points, valid
+
+def reproject_disparity(disparity: ndarray, Q: ndarray, out: ndarray | None = None, fixed_point: bool = True) -> tuple[ndarray, ndarray]:
+    """
+    Reprojects a whole disparity map to a 3D point image.
+
+    ### Parameters
+        `disparity: ndarray`:
+            HxW disparity map, like the one `depth_map` returns.
+        `Q: ndarray`:
+            Disparity-to-depth matrix from stereo calibration or `reprojection_matrix`.
+        `out: ndarray | None`:
+            HxWx3 float32 array to write into.
+        `fixed_point: bool`:
+            Disparity is SGBM fixed-point (x16). Set False for disparities in pixels.
+
+    ### Returns
+        HxWx3 float32 point image and the HxW valid mask. Points with zero or negative disparity are NaN.
+    """
+    with profile("reproject"):
+        if fixed_point:
+            disparity = np.multiply(disparity, 1 / 16, dtype=np.float32)
+        else:
+            disparity = np.asarray(disparity, np.float32)
+
+        out = cv2.reprojectImageTo3D(disparity, np.asarray(Q, np.float64), out)
+        valid = disparity > 0
+        out[~valid] = np.nan
+
+    return out, valid
+
 def depth_map(imgL, imgR):
-    """ Depth map calculation. Works with SGBM and WLS. Need rectified images, returns depth map ( left to right disparity ) """
-    # SGBM Parameters -----------------
-    window_size = 5  # wsize default 3; 5; 7 for SGBM reduced size image; 15 for SGBM full size image (1300px and above); 5 Works nicely
-
-    left_matcher = cv2.StereoSGBM_create(
-        minDisparity=-1,
-        numDisparities=5*16,  # max_disp has to be dividable by 16 f. E. HH 192, 256
-        blockSize=window_size,
-        P1=8 * 3 * window_size,
-        # wsize default 3; 5; 7 for SGBM reduced size image; 15 for SGBM full size image (1300px and above); 5 Works nicely
-        P2=32 * 3 * window_size,
-        disp12MaxDiff=12,
-        uniquenessRatio=10,
-        speckleWindowSize=50,
-        speckleRange=32,
-        preFilterCap=63,
-        mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY
-    )
-    right_matcher = cv2.ximgproc.createRightMatcher(left_matcher)
-    # FILTER Parameters
-    lmbda = 80000
-    sigma = 1.3
-    visual_multiplier = 6
-
-    wls_filter = cv2.ximgproc.createDisparityWLSFilter(matcher_left=left_matcher)
-    wls_filter.setLambda(lmbda)
-
-    wls_filter.setSigmaColor(sigma)
-    displ = left_matcher.compute(imgL, imgR)  # .astype(np.float32)/16
-    disp = displ
-    dispr = right_matcher.compute(imgR, imgL)  # .astype(np.float32)/16
-    displ = np.int16(displ)
-    dispr = np.int16(dispr)
-    filteredImg = wls_filter.filter(displ, imgL, None, dispr, right_view=imgR)  # important to put "imgL" here!!!
-
-    filteredImg = cv2.normalize(src=filteredImg, dst=filteredImg, beta=0, alpha=255, norm_type=cv2.NORM_MINMAX);
-    filteredImg = np.uint8(filteredImg)
-
-    return filteredImg, disp
+    """ Depth map calculation. Works with SGBM and WLS. Need rectified images, returns depth map ( left to right disparity )
+
+    Thin wrapper over the module-level `StereoDepthEngine`, so matchers and buffers are created only once.
+    Returned arrays are reused by the next call, copy them if you need to keep them.
+    """
+    engine = default_depth_engine()
 
+    filteredImg = engine.compute(imgL, imgR)
+    filteredImg = engine.normalize(filteredImg)
+
+    return filteredImg, engine.disparity_left
+
+def metric_depth_map(imgL: cv2.Mat | ndarray, imgR: cv2.Mat | ndarray, focal_length: float, baseline: float,
+                     out: ndarray | None = None, millimeters: bool = False) -> ndarray:
+    """
+    Metric version of `depth_map`. Depth is looked up from the fixed-point disparity, no normalization pass,
+    so the values keep their scale from frame to frame. Colorize it with `visual_utils.colorize_depth` if needed.
+
+    ### Parameters
+        `imgL, imgR: cv2.Mat | ndarray`:
+            Rectified grayscale images.
+        `focal_length: float`:
+            Rectified focal length in pixels, `StereoCalibration.focal_length`.
+        `baseline: float`:
+            Distance between the cameras in meters.
+        `out: ndarray | None`:
+            float32 (meters) or int16 (millimeters) array to write into.
+        `millimeters: bool`:
+            int16 millimeters instead of float32 meters.
+
+    ### Returns
+        Depth map. Pixels without a valid disparity are NaN in meters and 0 in millimeters.
+    """
+    disparity = default_depth_engine().compute(imgL, imgR)
+    return disparity_to_depth(disparity, focal_length, baseline, out, millimeters)
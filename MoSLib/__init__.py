@@ -1,4 +1,8 @@
-from .MoSLib import (ORB_detector, perspective_projection, depth_map)
+from .MoSLib import (ORB_detector, perspective_projection, reprojection_matrix, triangulate_points, reproject_disparity, depth_map, metric_depth_map)
+from .depth_engine import (DepthConfig, StereoDepthEngine, BoxDepth, disparity_to_depth)
+from .features import (FrameFeatures, ORBMatcher, FeatureTracker, StereoTracks)
+from .pipeline import (AsyncDepthPipeline, DepthFrame)
+from .process_pipeline import (ProcessPipeline, PipelineFrame, Stage, DepthStage, MarkerStage)
 
 from .utils import (math_utils, visual_utils)
 
@@ -0,0 +1,620 @@
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from numpy import ndarray
+from dataclasses import dataclass, replace
+from .utils.profiling_utils import profile
+
+
+@dataclass
+class DepthConfig:
+    """
+    SGBM and WLS parameters of a `StereoDepthEngine`. Defaults are the values `depth_map` always used.
+
+    ### Parameters
+        `min_disparity: int`:
+            Minimum possible disparity value.
+        `num_disparities: int`:
+            Disparity search range. Has to be dividable by 16.
+        `block_size: int`:
+            Matched block size. 3; 5; 7 for SGBM reduced size image; 15 for SGBM full size image (1300px and above).
+        `p1: int | None`:
+            First smoothness penalty. `8 * 3 * block_size` if not given.
+        `p2: int | None`:
+            Second smoothness penalty. `32 * 3 * block_size` if not given.
+        `wls_lambda: float`:
+            Regularization strength of the WLS filter.
+        `wls_sigma: float`:
+            Edge sensitivity of the WLS filter.
+        `pyramid_levels: int`:
+            Coarse-to-fine mode if positive. Disparity is first computed on images downscaled `2**pyramid_levels` times,
+            then refined at full resolution in horizontal strips, each searching only the narrow window the coarse result allows.
+        `pyramid_margin: int`:
+            Pixels added on both sides of the coarse disparity window of a strip.
+        `pyramid_strip_height: int`:
+            Row count of the refinement strips.
+        `temporal_tile_size: int`:
+            Temporal mode if positive. Frames are split into tiles of this size and only tiles whose left view changed
+            since they were last computed are matched again, the rest keep their previous disparity.
+        `temporal_threshold: int`:
+            Absolute gray level difference that marks a pixel as changed.
+        `temporal_changed_fraction: float`:
+            Fraction of changed pixels that marks a tile as changed.
+        `temporal_refresh_interval: int`:
+            A full frame is computed at least every this many frames.
+        `temporal_margin: int`:
+            Context pixels matched around the changed tiles.
+        `threads: int`:
+            Parallel mode if bigger than 1. The pair is split into this many horizontal strips, matched and filtered
+            on a thread pool and stitched back together. Ignored in coarse-to-fine mode, which takes precedence.
+            In temporal mode only the full refreshes use the strips, changed tiles are matched on the calling thread.
+        `strip_overlap: int`:
+            Context rows matched above and below each strip and thrown away when stitching. Never less than `block_size`.
+    """
+
+    min_disparity: int = -1
+    num_disparities: int = 5*16
+    block_size: int = 5
+    p1: int | None = None
+    p2: int | None = None
+    disp12_max_diff: int = 12
+    uniqueness_ratio: int = 10
+    speckle_window_size: int = 50
+    speckle_range: int = 32
+    pre_filter_cap: int = 63
+    mode: int = cv2.STEREO_SGBM_MODE_SGBM_3WAY
+    wls_lambda: float = 80000
+    wls_sigma: float = 1.3
+    pyramid_levels: int = 0
+    pyramid_margin: int = 2
+    pyramid_strip_height: int = 48
+    temporal_tile_size: int = 0
+    temporal_threshold: int = 12
+    temporal_changed_fraction: float = 0.01
+    temporal_refresh_interval: int = 30
+    temporal_margin: int = 16
+    threads: int = 1
+    strip_overlap: int = 16
+
+
+def create_sgbm(config: DepthConfig, min_disparity: int | None = None, num_disparities: int | None = None) -> cv2.StereoSGBM:
+    """ Creates the left SGBM matcher described by the config. Disparity window can be overridden. """
+    return cv2.StereoSGBM_create(
+        minDisparity=config.min_disparity if min_disparity is None else min_disparity,
+        numDisparities=config.num_disparities if num_disparities is None else num_disparities,  # max_disp has to be dividable by 16 f. E. HH 192, 256
+        blockSize=config.block_size,
+        P1=config.p1 if config.p1 is not None else 8 * 3 * config.block_size,
+        P2=config.p2 if config.p2 is not None else 32 * 3 * config.block_size,
+        disp12MaxDiff=config.disp12_max_diff,
+        uniquenessRatio=config.uniqueness_ratio,
+        speckleWindowSize=config.speckle_window_size,
+        speckleRange=config.speckle_range,
+        preFilterCap=config.pre_filter_cap,
+        mode=config.mode
+    )
+
+
+@dataclass
+class BoxDepth:
+    """
+    Depth statistics of a bounding box.
+
+    ### Parameters
+        `box: tuple[tuple[int, int], tuple[int, int]]`:
+            Top left and bottom right locations of the box, clipped to the frame.
+        `distance: float`:
+            Median distance of the valid pixels, in the unit of the baseline. NaN if there is none.
+        `percentiles: tuple[float, ...]`:
+            Distances at the requested percentiles.
+        `valid_fraction: float`:
+            Fraction of the box pixels with a positive disparity.
+        `disparity: float`:
+            Median disparity of the valid pixels in pixels.
+    """
+
+    box: tuple[tuple[int, int], tuple[int, int]]
+    distance: float
+    percentiles: tuple[float, ...]
+    valid_fraction: float
+    disparity: float
+
+
+class StereoDepthEngine:
+    """
+    Reusable SGBM + WLS disparity engine. Matchers, filter and output buffers are created once
+    and kept across frames, so a capture loop only pays for the matching itself.
+
+    ### Parameters
+        `config: DepthConfig | None`:
+            Matcher and filter parameters. Defaults of `DepthConfig` if not given.
+        `focal_length: float | None`:
+            Rectified focal length in pixels. Needed for metric results.
+        `baseline: float | None`:
+            Distance between the cameras. Metric results are in its unit.
+    """
+
+    def __init__(self, config: DepthConfig | None = None, focal_length: float | None = None, baseline: float | None = None):
+        self.config = config if config is not None else DepthConfig()
+        self.focal_length = focal_length
+        self.baseline = baseline
+
+        self.left_matcher = create_sgbm(self.config)
+        self.right_matcher = cv2.ximgproc.createRightMatcher(self.left_matcher)
+
+        self.wls_filter = cv2.ximgproc.createDisparityWLSFilter(matcher_left=self.left_matcher)
+        self.wls_filter.setLambda(self.config.wls_lambda)
+        self.wls_filter.setSigmaColor(self.config.wls_sigma)
+
+        self.shape = None
+        self.disparity_left = None  # Raw left to right disparity, fixed-point int16 (x16)
+        self.disparity_right = None  # Raw right to left disparity, fixed-point int16 (x16)
+        self.disparity = None  # WLS filtered disparity, fixed-point int16 (x16)
+        self.disparity_image = None  # uint8 normalized disparity for visualization
+
+        self._coarse = None  # Pyramid mode matchers and buffers
+        self._coarse_buffers = None
+        self._window_matchers = {}
+
+        self._reference = None  # Temporal mode: left view of every tile when it was last matched
+        self._frames_since_refresh = 0
+        self.tiles_total = 0  # Temporal mode counters
+        self.tiles_skipped = 0
+        self.last_skip_fraction = 0.0
+
+        self._executor = None  # Parallel mode pool and its per-thread matchers
+        self._local = threading.local()
+
+    @property
+    def skip_fraction(self) -> float:
+        """ Fraction of tiles the temporal mode didn't match again, over all frames since the last `reset_counters`. """
+        return self.tiles_skipped / self.tiles_total if self.tiles_total else 0.0
+
+    def reset_counters(self) -> None:
+        self.tiles_total = 0
+        self.tiles_skipped = 0
+        self.last_skip_fraction = 0.0
+
+    @classmethod
+    def from_calibration(cls, calibration, config: DepthConfig | None = None) -> "StereoDepthEngine":
+        """ Creates the engine with the focal length and baseline of a `StereoCalibration`. """
+        return cls(config, focal_length=calibration.focal_length, baseline=calibration.baseline)
+
+    def close(self) -> None:
+        """ Shuts the parallel mode thread pool down. The engine can still be used, the pool is created again if needed. """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _ensure_buffers(self, shape: tuple[int, int]) -> None:
+        """ (Re)allocates the output buffers when the frame size changes. """
+        if self.shape == shape:
+            return
+
+        self.shape = shape
+        self.disparity_left = np.empty(shape, np.int16)
+        self.disparity_right = np.empty(shape, np.int16)
+        self.disparity = np.empty(shape, np.int16)
+        self.disparity_image = np.empty(shape, np.uint8)
+        self._coarse_buffers = None
+        self._reference = None
+
+    def compute(self, left: cv2.Mat | ndarray, right: cv2.Mat | ndarray, out: ndarray | None = None) -> ndarray:
+        """
+        Computes the WLS filtered left to right disparity of a rectified pair.
+
+        ### Parameters
+            `left: cv2.Mat | ndarray`:
+                Rectified grayscale left image.
+            `right: cv2.Mat | ndarray`:
+                Rectified grayscale right image.
+            `out: ndarray | None`:
+                int16 array with the image size to write into. Engine buffer is used if not given.
+
+        ### Returns
+            Filtered fixed-point disparity (divide by 16 for pixels). The engine buffer is
+            overwritten by the next call, copy it or pass `out` if you need to keep it.
+        """
+        self._ensure_buffers(left.shape[:2])
+        if out is None:
+            out = self.disparity
+
+        temporal = self.config.temporal_tile_size > 0
+        if temporal and self._reference is not None and self._frames_since_refresh + 1 < self.config.temporal_refresh_interval:
+            with profile("sgbm_wls_temporal"):
+                self._compute_temporal(left, right)
+            if out is not self.disparity:
+                np.copyto(out, self.disparity)
+            return out
+
+        if self.config.threads > 1 and self.config.pyramid_levels <= 0:
+            with profile("sgbm_wls_parallel"):
+                self._compute_parallel(left, right, out)
+        else:
+            with profile("sgbm"):
+                if self.config.pyramid_levels > 0:
+                    self._compute_pyramid(left, right)
+                else:
+                    self.left_matcher.compute(left, right, self.disparity_left)
+                    self.right_matcher.compute(right, left, self.disparity_right)
+            with profile("wls"):
+                self.wls_filter.filter(self.disparity_left, left, out, self.disparity_right, right_view=right)  # important to put "left" here!!!
+
+        if temporal:  # Full refresh, every tile is up to date
+            if out is not self.disparity:
+                np.copyto(self.disparity, out)
+            if self._reference is None:
+                self._reference = np.empty_like(left)
+            np.copyto(self._reference, left)
+            self._frames_since_refresh = 0
+            tiles = _tile_count(left.shape[:2], self.config.temporal_tile_size)
+            self.tiles_total += tiles
+            self.last_skip_fraction = 0.0
+
+        return out
+
+    def _compute_temporal(self, left: ndarray, right: ndarray) -> None:
+        """ Matches only the changed tiles again, into the engine buffers. """
+        config = self.config
+        tile = config.temporal_tile_size
+        height, width = left.shape[:2]
+
+        # Changed pixel count of every tile against its reference. Counting instead of averaging
+        # catches small changes at tile edges, which a tile mean would hide.
+        difference = cv2.absdiff(left, self._reference)
+        if difference.ndim == 3:
+            difference = difference.max(axis=2)
+        moved = difference > config.temporal_threshold
+        row_starts, col_starts = np.arange(0, height, tile), np.arange(0, width, tile)
+        counts = np.add.reduceat(np.add.reduceat(moved, row_starts, axis=0, dtype=np.int32), col_starts, axis=1)
+        areas = np.outer(np.diff(np.append(row_starts, height)), np.diff(np.append(col_starts, width)))
+        changed = counts > config.temporal_changed_fraction * areas
+
+        for row, cols in enumerate(changed):
+            if not cols.any():
+                continue
+            y0, y1 = row * tile, min(height, (row + 1) * tile)
+            # Neighbouring changed tiles of a row are matched together
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], cols.view(np.int8), [0]))))
+            for first, last in zip(edges[0::2], edges[1::2]):
+                self._compute_region(left, right, y0, y1, first * tile, min(width, last * tile))
+
+        self._frames_since_refresh += 1
+        self.tiles_total += changed.size
+        self.tiles_skipped += changed.size - int(changed.sum())
+        self.last_skip_fraction = 1 - changed.sum() / changed.size
+
+    def _compute_region(self, left: ndarray, right: ndarray, y0: int, y1: int, x0: int, x1: int) -> None:
+        """ Left, right and filtered disparity of a region into the engine buffers, matched with surrounding context. """
+        config = self.config
+        height, width = left.shape[:2]
+        pad = max(config.temporal_margin, config.block_size)
+        search = max(0, config.min_disparity + config.num_disparities)
+
+        top, bottom = max(0, y0 - pad), min(height, y1 + pad)
+        start, end = max(0, x0 - search - pad), min(width, x1 + search + pad)  # Both views need the search range
+        region_left, region_right = left[top:bottom, start:end], right[top:bottom, start:end]
+
+        disparity_left = self.left_matcher.compute(region_left, region_right)
+        disparity_right = self.right_matcher.compute(region_right, region_left)
+        filtered = self.wls_filter.filter(disparity_left, region_left, None, disparity_right, right_view=region_right)
+
+        inner = np.s_[y0 - top:y1 - top, x0 - start:x1 - start]
+        self.disparity[y0:y1, x0:x1] = filtered[inner]
+        self.disparity_left[y0:y1, x0:x1] = disparity_left[inner]
+        self.disparity_right[y0:y1, x0:x1] = disparity_right[inner]
+        self._reference[y0:y1, x0:x1] = left[y0:y1, x0:x1]
+
+    def _thread_matchers(self) -> tuple[cv2.StereoSGBM, cv2.StereoMatcher, cv2.ximgproc.DisparityWLSFilter]:
+        """ Left matcher, right matcher and WLS filter of the calling thread, created on its first strip. """
+        matchers = getattr(self._local, "matchers", None)
+        if matchers is None:
+            left_matcher = create_sgbm(self.config)
+            wls_filter = cv2.ximgproc.createDisparityWLSFilter(matcher_left=left_matcher)
+            wls_filter.setLambda(self.config.wls_lambda)
+            wls_filter.setSigmaColor(self.config.wls_sigma)
+            matchers = self._local.matchers = (left_matcher, cv2.ximgproc.createRightMatcher(left_matcher), wls_filter)
+        return matchers
+
+    def _compute_parallel(self, left: ndarray, right: ndarray, out: ndarray) -> None:
+        """ Strip-parallel left, right and filtered disparity. OpenCV releases the GIL, so the strips really run together. """
+        config = self.config
+        height = left.shape[0]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=config.threads, thread_name_prefix="StereoDepthEngine")
+
+        strip_height = -(-height // config.threads)
+        pad = max(config.block_size, config.strip_overlap)
+        futures = [self._executor.submit(self._compute_strip, left, right, y0, min(height, y0 + strip_height), pad, out)
+                   for y0 in range(0, height, strip_height)]
+        for future in futures:
+            future.result()  # Raises the exception of a failed strip
+
+    def _compute_strip(self, left: ndarray, right: ndarray, y0: int, y1: int, pad: int, out: ndarray) -> None:
+        """ Matches and filters rows `y0:y1` with `pad` context rows, then writes only the own rows of the strip. """
+        left_matcher, right_matcher, wls_filter = self._thread_matchers()
+        top, bottom = max(0, y0 - pad), min(left.shape[0], y1 + pad)
+        strip_left, strip_right = left[top:bottom], right[top:bottom]
+
+        disparity_left = left_matcher.compute(strip_left, strip_right)
+        disparity_right = right_matcher.compute(strip_right, strip_left)
+        filtered = wls_filter.filter(disparity_left, strip_left, None, disparity_right, right_view=strip_right)
+
+        inner = slice(y0 - top, y1 - top)
+        self.disparity_left[y0:y1] = disparity_left[inner]
+        self.disparity_right[y0:y1] = disparity_right[inner]
+        out[y0:y1] = filtered[inner]
+
+    def _window_matcher(self, min_disparity: int, num_disparities: int) -> cv2.StereoSGBM:
+        """ Left matcher searching only the given disparity window, created once per window. """
+        key = (min_disparity, num_disparities)
+        if key not in self._window_matchers:
+            self._window_matchers[key] = create_sgbm(self.config, min_disparity, num_disparities)
+        return self._window_matchers[key]
+
+    def _compute_pyramid(self, left: ndarray, right: ndarray) -> None:
+        """ Coarse-to-fine left and right disparities into the engine buffers. """
+        config = self.config
+        scale = 2 ** config.pyramid_levels
+        height, width = left.shape[:2]
+
+        if self._coarse is None:
+            coarse_config = replace(config, min_disparity=config.min_disparity // scale,
+                                    num_disparities=_round16(-(-config.num_disparities // scale)), pyramid_levels=0)
+            coarse_matcher = create_sgbm(coarse_config)
+            self._coarse = (coarse_config, coarse_matcher, cv2.ximgproc.createRightMatcher(coarse_matcher))
+        coarse_config, coarse_left_matcher, coarse_right_matcher = self._coarse
+
+        small_size = (max(1, width // scale), max(1, height // scale))
+        if self._coarse_buffers is None:
+            self._coarse_buffers = (np.empty(small_size[::-1], left.dtype), np.empty(small_size[::-1], right.dtype),
+                                    np.empty(small_size[::-1], np.int16), np.empty(small_size[::-1], np.int16),
+                                    np.empty((height, width), np.int16))
+        small_left, small_right, coarse_left, coarse_right, upsampled = self._coarse_buffers
+
+        cv2.resize(left, small_size, dst=small_left, interpolation=cv2.INTER_AREA)
+        cv2.resize(right, small_size, dst=small_right, interpolation=cv2.INTER_AREA)
+        coarse_left_matcher.compute(small_left, small_right, coarse_left)
+        coarse_right_matcher.compute(small_right, small_left, coarse_right)
+
+        # Right view disparity only feeds the WLS confidence, the upsampled coarse one is enough.
+        cv2.resize(coarse_right, (width, height), dst=self.disparity_right, interpolation=cv2.INTER_NEAREST)
+        np.multiply(self.disparity_right, scale, out=self.disparity_right, casting="unsafe")
+        cv2.resize(coarse_left, (width, height), dst=upsampled, interpolation=cv2.INTER_NEAREST)
+        upsampled_invalid = upsampled < coarse_config.min_disparity * 16
+        np.multiply(upsampled, scale, out=upsampled, casting="unsafe")
+        upsampled[upsampled_invalid] = (config.min_disparity - 1) * 16
+
+        coarse_valid = coarse_config.min_disparity * 16
+        low_limit, high_limit = config.min_disparity, config.min_disparity + config.num_disparities
+        pad = config.block_size
+
+        for y0 in range(0, height, config.pyramid_strip_height):
+            y1 = min(height, y0 + config.pyramid_strip_height)
+            target = self.disparity_left[y0:y1]
+
+            rows = coarse_left[y0 // scale:-(-y1 // scale)]
+            valid = rows[rows >= coarse_valid]
+            if valid.size == 0:  # Nothing to seed the window, keep the coarse result
+                target[:] = upsampled[y0:y1]
+                continue
+
+            low, high = np.percentile(valid, (1, 99)) * (scale / 16)
+            low = max(low_limit, int(np.floor(low)) - config.pyramid_margin - scale)
+            high = min(high_limit, int(np.ceil(high)) + config.pyramid_margin + scale)
+            num_disparities = min(_round16(high - low), config.num_disparities)
+            low = min(low, high_limit - num_disparities)
+
+            _match_rows(self._window_matcher(low, num_disparities), left, right, y0, y1, pad, target)
+            np.copyto(target, upsampled[y0:y1], where=target < low * 16)  # Outside of the window or unmatched border
+
+    def measure_boxes(self, left: cv2.Mat | ndarray, right: cv2.Mat | ndarray, boxes: list, percentiles: tuple[float, ...] = (10, 90)) -> list[BoxDepth]:
+        """
+        Distance statistics inside bounding boxes. Disparity is computed only for horizontal strips covering the boxes,
+        padded on the left by the disparity search range, instead of the whole frame. WLS is skipped, the median is robust enough.
+
+        ### Parameters
+            `left: cv2.Mat | ndarray`:
+                Rectified grayscale left image.
+            `right: cv2.Mat | ndarray`:
+                Rectified grayscale right image.
+            `boxes: list`:
+                Boxes in the left image, as ((x0, y0), (x1, y1)) like `visual_utils.create_bounding_box` takes.
+            `percentiles: tuple[float, ...]`:
+                Distance percentiles to report.
+
+        ### Returns
+            A `BoxDepth` per box, in the same order.
+        """
+        if self.focal_length is None or self.baseline is None:
+            raise ValueError("focal_length and baseline are needed for metric distances, see StereoDepthEngine.from_calibration")
+
+        config = self.config
+        height, width = left.shape[:2]
+        pad = config.block_size
+        search = max(0, config.min_disparity + config.num_disparities)
+
+        clipped = []
+        for box in boxes:
+            x0, y0, x1, y1 = (int(v) for v in np.asarray(box).reshape(4))
+            clipped.append((min(max(x0, 0), width), min(max(y0, 0), height), min(max(x1, 0), width), min(max(y1, 0), height)))
+
+        # Boxes whose padded rows overlap share one strip
+        bands = []
+        for i in sorted(range(len(clipped)), key=lambda i: clipped[i][1]):
+            x0, y0, x1, y1 = clipped[i]
+            if bands and y0 - pad <= bands[-1][3] + pad:
+                band = bands[-1]
+                band[0], band[2], band[3] = min(band[0], x0), max(band[2], x1), max(band[3], y1)
+                band[4].append(i)
+            else:
+                bands.append([x0, y0, x1, y1, [i]])
+
+        # SGBM needs a crop wider than its search range, boxes at the left edge take more columns on the right
+        min_width = search + pad
+        results = [None] * len(clipped)
+        for bx0, by0, bx1, by1, members in bands:
+            top, bottom = max(0, by0 - pad), min(height, by1 + pad)
+            start, end = max(0, bx0 - search - pad), min(width, bx1 + pad)
+            if end - start < min_width:
+                end = min(width, start + min_width)
+                start = max(0, end - min_width)
+            if end - start < min_width or bottom <= top:  # Frame narrower than the search range, or empty boxes
+                for i in members:
+                    x0, y0, x1, y1 = clipped[i]
+                    results[i] = self._box_depth(((x0, y0), (x1, y1)), np.empty(0, np.int16), 0, percentiles)
+                continue
+            disparity = self.left_matcher.compute(left[top:bottom, start:end], right[top:bottom, start:end])
+
+            for i in members:
+                x0, y0, x1, y1 = clipped[i]
+                values = disparity[y0 - top:y1 - top, x0 - start:x1 - start]
+                valid = values[values > 0]
+                results[i] = self._box_depth(((x0, y0), (x1, y1)), valid, values.size, percentiles)
+
+        return results
+
+    def _box_depth(self, box: tuple, valid: ndarray, area: int, percentiles: tuple[float, ...]) -> BoxDepth:
+        """ Statistics of the valid fixed-point disparities of a box. """
+        if valid.size == 0:
+            return BoxDepth(box, float("nan"), tuple(float("nan") for _ in percentiles), 0.0, float("nan"))
+
+        # Distance falls as disparity grows, so the p-th distance percentile is the (100 - p)-th disparity percentile.
+        disparities = np.percentile(valid, [50] + [100 - p for p in percentiles]) / 16
+        distances = self.focal_length * self.baseline / disparities
+        return BoxDepth(box, float(distances[0]), tuple(float(d) for d in distances[1:]), valid.size / area, float(disparities[0]))
+
+    def depth(self, disparity: ndarray | None = None, out: ndarray | None = None, millimeters: bool = False, meters_per_unit: float = 1.0) -> ndarray:
+        """
+        Metric depth of a fixed-point disparity map with the engine focal length and baseline. See `disparity_to_depth`.
+
+        ### Parameters
+            `disparity: ndarray | None`:
+                int16 fixed-point disparity. Last filtered disparity if not given.
+            `out: ndarray | None`:
+                float32 (meters) or int16 (millimeters) array to write into. A new array is returned if not given.
+            `millimeters: bool`:
+                int16 millimeters instead of float32 meters.
+            `meters_per_unit: float`:
+                Meters per baseline unit, e.g. 0.01 if the calibration square size was given in cm.
+
+        ### Returns
+            Depth map.
+        """
+        if self.focal_length is None or self.baseline is None:
+            raise ValueError("focal_length and baseline are needed for metric distances, see StereoDepthEngine.from_calibration")
+        if disparity is None:
+            disparity = self.disparity
+        return disparity_to_depth(disparity, self.focal_length, self.baseline * meters_per_unit, out, millimeters)
+
+    def normalize(self, disparity: ndarray | None = None, out: ndarray | None = None) -> ndarray:
+        """
+        Min-max normalizes a disparity map to uint8 for displaying.
+
+        ### Parameters
+            `disparity: ndarray | None`:
+                Disparity to normalize. Last filtered disparity if not given.
+            `out: ndarray | None`:
+                uint8 array to write into. Engine buffer is used if not given.
+
+        ### Returns
+            Normalized disparity image.
+        """
+        if disparity is None:
+            disparity = self.disparity
+        if out is None:
+            self._ensure_buffers(disparity.shape[:2])
+            out = self.disparity_image
+
+        return cv2.normalize(src=disparity, dst=out, beta=0, alpha=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+
+@lru_cache(maxsize=8)
+def depth_lut(focal_length: float, baseline: float, millimeters: bool = False) -> ndarray:
+    """
+    Depth of every int16 fixed-point disparity, indexed by the disparity bits read as uint16.
+    Zero and negative disparities have no depth: NaN in meters, 0 in millimeters.
+
+    ### Parameters
+        `focal_length: float`:
+            Rectified focal length in pixels.
+        `baseline: float`:
+            Distance between the cameras in meters.
+        `millimeters: bool`:
+            int16 millimeters, saturated at 32767, instead of float32 meters.
+
+    ### Returns
+        65536 sized read-only table.
+    """
+    disparity = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.float64) / 16
+    with np.errstate(divide="ignore"):
+        depth = focal_length * baseline / disparity
+    depth[disparity <= 0] = np.nan
+
+    if millimeters:
+        lut = np.nan_to_num(np.clip(np.rint(depth * 1000), 0, np.iinfo(np.int16).max), nan=0).astype(np.int16)
+    else:
+        lut = depth.astype(np.float32)
+    lut.flags.writeable = False
+    return lut
+
+
+def disparity_to_depth(disparity: ndarray, focal_length: float, baseline: float, out: ndarray | None = None, millimeters: bool = False) -> ndarray:
+    """
+    Converts a fixed-point int16 disparity map to metric depth with one table lookup per pixel.
+
+    ### Parameters
+        `disparity: ndarray`:
+            int16 fixed-point disparity (x16), like `StereoDepthEngine.compute` returns.
+        `focal_length: float`:
+            Rectified focal length in pixels.
+        `baseline: float`:
+            Distance between the cameras in meters.
+        `out: ndarray | None`:
+            float32 (meters) or int16 (millimeters) array with the disparity shape to write into.
+        `millimeters: bool`:
+            int16 millimeters instead of float32 meters.
+
+    ### Returns
+        Depth map. Pixels without a valid disparity are NaN in meters and 0 in millimeters.
+    """
+    if disparity.dtype != np.int16:
+        raise TypeError(f"Fixed-point int16 disparity expected, got {disparity.dtype}")
+    lut = depth_lut(float(focal_length), float(baseline), millimeters)
+    if out is None:
+        out = np.empty(disparity.shape, lut.dtype)
+    return np.take(lut, disparity.view(np.uint16), out=out, mode="clip")  # "clip" writes straight into out, "raise" buffers
+
+
+def _tile_count(shape: tuple[int, int], tile: int) -> int:
+    return -(-shape[0] // tile) * -(-shape[1] // tile)
+
+
+def _round16(value: int) -> int:
+    """ Rounds up to a positive multiple of 16, as SGBM wants for numDisparities. """
+    return max(16, -(-int(value) // 16) * 16)
+
+
+def _match_rows(matcher: cv2.StereoSGBM, left: ndarray, right: ndarray, y0: int, y1: int, pad: int, out: ndarray) -> None:
+    """ Left disparity of rows `y0:y1` into `out`, matched with `pad` rows of context above and below. """
+    top, bottom = max(0, y0 - pad), min(left.shape[0], y1 + pad)
+    disparity = matcher.compute(left[top:bottom], right[top:bottom])
+    out[:] = disparity[y0 - top:y1 - top]
+
+
+_default_engine = None
+
+
+def default_depth_engine() -> StereoDepthEngine:
+    """ Returns the module-level engine used by `depth_map`. It is created on the first call. """
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = StereoDepthEngine()
+    return _default_engine
@@ -0,0 +1,417 @@
+import cv2
+import numpy as np
+from numpy import ndarray
+from collections import OrderedDict
+from dataclasses import dataclass
+from .utils.profiling_utils import profile
+
+# FLANN index parameters for binary descriptors
+FLANN_INDEX_LSH = 6
+
+# Set bit count of every byte, Hamming distance of descriptors is the sum over their XOR bytes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+
+@dataclass
+class FrameFeatures:
+    """
+    Keypoints and descriptors of a single frame.
+
+    ### Parameters
+        `keypoints: tuple`:
+            Detected `cv2.KeyPoint`s.
+        `descriptors: ndarray | None`:
+            Nx32 uint8 ORB descriptors. `None` if nothing is detected.
+        `points: ndarray`:
+            Nx2 float32 keypoint locations.
+    """
+
+    keypoints: tuple
+    descriptors: ndarray | None
+    points: ndarray
+
+    def __len__(self) -> int:
+        return len(self.keypoints)
+
+
+class ORBMatcher:
+    """
+    Staged ORB feature matching. Detection, matching and drawing are separate, so a view can be
+    detected once and matched against several others.
+
+    ### Parameters
+        `nfeatures: int`:
+            Maximum number of features to detect per frame.
+        `ratio: float`:
+            Lowe ratio test threshold.
+        `use_flann: bool`:
+            Use FLANN-LSH instead of brute-force Hamming matching. Faster for large feature counts.
+        `cache_size: int`:
+            Number of frames whose features are kept by `detect(..., key=...)`.
+    """
+
+    def __init__(self, nfeatures: int = 1000, ratio: float = 0.75, use_flann: bool = False, cache_size: int = 4):
+        self.orb = cv2.ORB_create(nfeatures=nfeatures)
+        self.ratio = ratio
+        self.use_flann = use_flann
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+        if use_flann:
+            self.flann = cv2.FlannBasedMatcher(dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1),
+                                               dict(checks=50))
+
+    def detect(self, img: cv2.Mat | ndarray, key=None) -> FrameFeatures:
+        """
+        Detects ORB keypoints and descriptors.
+
+        ### Parameters
+            `img: cv2.Mat | ndarray`:
+                Grayscale image/frame.
+            `key`:
+                Any hashable frame identity, e.g. `(frame_index, "left")`. Features of a key seen recently are
+                returned from the cache instead of being detected again.
+
+        ### Returns
+            Features of the frame.
+        """
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        with profile("orb_detect"):
+            keypoints, descriptors = self.orb.detectAndCompute(img, None)
+        points = cv2.KeyPoint_convert(keypoints).reshape(-1, 2) if keypoints else np.empty((0, 2), np.float32)
+        features = FrameFeatures(keypoints, descriptors, points)
+
+        if key is not None and self.cache_size > 0:
+            self._cache[key] = features
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return features
+
+    def knn(self, features1: FrameFeatures, features2: FrameFeatures) -> tuple[ndarray, ndarray]:
+        """ Two nearest neighbours of every query descriptor as Nx2 distance and Nx2 train index arrays. """
+        if self.use_flann:
+            matches = [m for m in self.flann.knnMatch(features1.descriptors, features2.descriptors, k=2) if len(m) == 2]
+            distances = np.array([(m.distance, n.distance) for m, n in matches], np.float32).reshape(-1, 2)
+            indices = np.array([(m.queryIdx, m.trainIdx) for m, _ in matches], np.int32).reshape(-1, 2)
+            return distances, indices
+
+        distances, trainIdx = cv2.batchDistance(features1.descriptors, features2.descriptors, cv2.CV_32S,
+                                                normType=cv2.NORM_HAMMING, K=2)
+        indices = np.empty((len(trainIdx), 2), np.int32)
+        indices[:, 0] = np.arange(len(trainIdx))
+        indices[:, 1] = trainIdx[:, 0]
+        return distances, indices
+
+    def match(self, features1: FrameFeatures, features2: FrameFeatures) -> tuple[ndarray, ndarray]:
+        """
+        Matches two frames and filters the matches with the ratio test.
+
+        ### Parameters
+            `features1: FrameFeatures`:
+                Query frame features.
+            `features2: FrameFeatures`:
+                Train frame features.
+
+        ### Returns
+            Matched Nx2 float32 points of the first and second frame.
+        """
+        if len(features1) == 0 or len(features2) < 2:
+            return np.empty((0, 2), np.float32), np.empty((0, 2), np.float32)
+
+        with profile("orb_match"):
+            distances, indices = self.knn(features1, features2)
+            good = distances[:, 0] < self.ratio * distances[:, 1]
+
+        return features1.points[indices[good, 0]], features2.points[indices[good, 1]]
+
+    def match_rectified(self, features_left: FrameFeatures, features_right: FrameFeatures, row_tolerance: float = 2.0,
+                        min_disparity: float = 0.0, max_disparity: float = 128.0, max_distance: int = 64) -> tuple[ndarray, ndarray, ndarray]:
+        """
+        Sparse stereo matching of a rectified pair. A left feature is compared only with the right features in
+        its row band and disparity window, instead of all of them, then the ratio test picks among those.
+
+        ### Parameters
+            `features_left: FrameFeatures`:
+                Left view features.
+            `features_right: FrameFeatures`:
+                Right view features.
+            `row_tolerance: float`:
+                Largest row difference of a match in pixels, for the rectification error.
+            `min_disparity, max_disparity: float`:
+                Disparity window of a match in pixels.
+            `max_distance: int`:
+                Largest Hamming distance of a match. A feature with a single candidate is kept only below it.
+
+        ### Returns
+            Matched Nx2 float32 left and right points and N float32 disparities, ready for `triangulate_points`.
+        """
+        empty = np.empty((0, 2), np.float32), np.empty((0, 2), np.float32), np.empty(0, np.float32)
+        if len(features_left) == 0 or len(features_right) == 0:
+            return empty
+
+        with profile("orb_match_rectified"):
+            left_points, right_points = features_left.points, features_right.points
+
+            # Right features sorted by row, the band of a left feature is one contiguous run
+            order = np.argsort(right_points[:, 1], kind="stable")
+            rows = right_points[order, 1]
+            starts = np.searchsorted(rows, left_points[:, 1] - row_tolerance, "left")
+            ends = np.searchsorted(rows, left_points[:, 1] + row_tolerance, "right")
+            counts = ends - starts
+
+            # Every (left, right) candidate pair of the bands
+            left_index = np.repeat(np.arange(len(left_points)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            right_index = order[np.repeat(starts, counts) + offsets]
+
+            disparities = left_points[left_index, 0] - right_points[right_index, 0]
+            inside = (disparities >= min_disparity) & (disparities <= max_disparity)
+            left_index, right_index, disparities = left_index[inside], right_index[inside], disparities[inside]
+            if len(left_index) == 0:
+                return empty
+
+            distances = _POPCOUNT[features_left.descriptors[left_index] ^ features_right.descriptors[right_index]].sum(axis=1, dtype=np.int32)
+
+            # Best and second best candidate of every left feature
+            ranked = np.lexsort((distances, left_index))
+            left_index, right_index, disparities, distances = left_index[ranked], right_index[ranked], disparities[ranked], distances[ranked]
+            first = np.flatnonzero(np.r_[True, left_index[1:] != left_index[:-1]])
+            has_second = np.r_[first[1:], len(left_index)] - first > 1
+            second = np.where(has_second, distances[np.minimum(first + 1, len(distances) - 1)], max_distance / self.ratio)
+            good = (distances[first] < self.ratio * second) & (distances[first] <= max_distance)
+            best = first[good]
+
+        return (left_points[left_index[best]], right_points[right_index[best]], disparities[best].astype(np.float32))
+
+
+@dataclass
+class StereoTracks:
+    """
+    Features tracked in both views of a rectified pair.
+
+    ### Parameters
+        `ids: ndarray`:
+            N persistent track ids. An id is never reused.
+        `left: ndarray`:
+            Nx2 float32 left view points.
+        `right: ndarray`:
+            Nx2 float32 right view points.
+        `disparity: ndarray`:
+            N float32 disparities in pixels, smoothed over the life of each track.
+        `age: ndarray`:
+            N frame counts since each track was detected.
+        `keyframe: bool`:
+            Whether features are detected in this frame.
+    """
+
+    ids: ndarray
+    left: ndarray
+    right: ndarray
+    disparity: ndarray
+    age: ndarray
+    keyframe: bool
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def depth(self, focal_length: float, baseline: float) -> ndarray:
+        """ Smoothed depth of every track in the unit of the baseline. NaN where the disparity isn't positive. """
+        depth = np.full(len(self.disparity), np.nan, np.float32)
+        np.divide(focal_length * baseline, self.disparity, out=depth, where=self.disparity > 0)
+        return depth
+
+
+class FeatureTracker:
+    """
+    Stereo feature tracker for rectified pairs. Features are detected and matched only on keyframes, and moved
+    to the next frames with pyramidal Lucas-Kanade optical flow in both views. Each track keeps its id, so
+    its disparity is smoothed over time. A keyframe is made when the track count falls below `min_tracks`,
+    or a grid cell that had tracks on the last keyframe has none left.
+
+    ### Parameters
+        `detector: str`:
+            "orb" matches ORB features of both views along their rows. "fast" detects FAST corners in the
+            left view and finds them in the right view with optical flow checked by flowing back, which is
+            cheaper but less reliable on repeated texture.
+        `nfeatures: int`:
+            Maximum number of features detected per keyframe.
+        `min_tracks: int`:
+            A keyframe is made when fewer tracks survive.
+        `grid: tuple[int, int]`:
+            Columns and rows of the grid used to find regions that run empty.
+        `max_keyframe_interval: int`:
+            A keyframe is made at least every this many frames. 0 never forces one.
+        `smoothing: float`:
+            Weight of the old disparity in the exponential moving average of a track.
+        `win_size: tuple[int, int]`:
+            Lucas-Kanade search window.
+        `max_level: int`:
+            Lucas-Kanade pyramid levels.
+        `row_tolerance: float`:
+            Largest row difference of the two views of a track in pixels.
+        `min_disparity, max_disparity: float`:
+            Disparity window of a track in pixels.
+        `min_distance: float`:
+            New features closer than this to a live track are dropped on keyframes.
+    """
+
+    def __init__(self, detector: str = "orb", nfeatures: int = 1000, min_tracks: int = 100, grid: tuple[int, int] = (4, 4),
+                 max_keyframe_interval: int = 0, smoothing: float = 0.7, win_size: tuple[int, int] = (21, 21), max_level: int = 3,
+                 row_tolerance: float = 2.0, min_disparity: float = 0.0, max_disparity: float = 128.0, min_distance: float = 8.0):
+        if detector not in ("orb", "fast"):
+            raise ValueError(f"Unknown detector: {detector}")
+
+        self.detector = detector
+        self.nfeatures = nfeatures
+        self.min_tracks = min_tracks
+        self.grid = grid
+        self.max_keyframe_interval = max_keyframe_interval
+        self.smoothing = smoothing
+        self.win_size = win_size
+        self.max_level = max_level
+        self.row_tolerance = row_tolerance
+        self.min_disparity = min_disparity
+        self.max_disparity = max_disparity
+        self.min_distance = min_distance
+
+        self.matcher = ORBMatcher(nfeatures=nfeatures, cache_size=0) if detector == "orb" else None
+        self.fast = cv2.FastFeatureDetector_create(threshold=20) if detector == "fast" else None
+
+        self.tracks = None
+        self.next_id = 0
+        self.frames_since_keyframe = 0
+        self.keyframes = 0
+        self._previous = None  # Copies of the last left and right images, callers may reuse their buffers
+        self._keyframe_cells = None  # Grid cells with tracks on the last keyframe
+
+    def reset(self) -> None:
+        """ Drops every track, the next frame is a keyframe. """
+        self.tracks = None
+        self._previous = None
+        self._keyframe_cells = None
+
+    def update(self, left: cv2.Mat | ndarray, right: cv2.Mat | ndarray) -> StereoTracks:
+        """
+        Tracks the features into a new pair.
+
+        ### Parameters
+            `left: cv2.Mat | ndarray`:
+                Rectified grayscale left image.
+            `right: cv2.Mat | ndarray`:
+                Rectified grayscale right image.
+
+        ### Returns
+            Live tracks of the pair.
+        """
+        if self.tracks is not None and len(self.tracks) > 0 and self._previous is not None:
+            with profile("klt_track"):
+                self.tracks = self._propagate(self.tracks, self._previous, (left, right))
+            self.frames_since_keyframe += 1
+
+        if self._needs_keyframe(left.shape[:2]):
+            with profile("klt_keyframe"):
+                self.tracks = self._keyframe(left, right)
+            self.frames_since_keyframe = 0
+            self.keyframes += 1
+
+        if self._previous is None or self._previous[0].shape != left.shape:
+            self._previous = (np.empty_like(left), np.empty_like(right))
+        np.copyto(self._previous[0], left)
+        np.copyto(self._previous[1], right)
+        return self.tracks
+
+    def _flow(self, previous: ndarray, current: ndarray, points: ndarray, guess: ndarray | None = None) -> tuple[ndarray, ndarray]:
+        """ Lucas-Kanade flow of the points, returns the new points and the found mask. """
+        flags = cv2.OPTFLOW_USE_INITIAL_FLOW if guess is not None else 0
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, points.reshape(-1, 1, 2), None if guess is None else guess.reshape(-1, 1, 2).copy(),
+                                                    winSize=self.win_size, maxLevel=self.max_level, flags=flags)
+        return moved.reshape(-1, 2), status.reshape(-1).astype(bool)
+
+    def _stereo_valid(self, left: ndarray, right: ndarray, shape: tuple[int, int]) -> ndarray:
+        """ Pairs that are inside the image, on the same row and inside the disparity window. """
+        height, width = shape
+        disparity = left[:, 0] - right[:, 0]
+        return ((np.abs(left[:, 1] - right[:, 1]) <= self.row_tolerance) & (disparity >= self.min_disparity) & (disparity <= self.max_disparity)
+                & (left[:, 0] >= 0) & (left[:, 0] < width) & (left[:, 1] >= 0) & (left[:, 1] < height))
+
+    def _propagate(self, tracks: StereoTracks, previous: tuple[ndarray, ndarray], current: tuple[ndarray, ndarray]) -> StereoTracks:
+        """ Moves the tracks to the current pair in both views and drops the lost ones. """
+        left, found_left = self._flow(previous[0], current[0], tracks.left)
+        right, found_right = self._flow(previous[1], current[1], tracks.right)
+        keep = found_left & found_right & self._stereo_valid(left, right, current[0].shape[:2])
+
+        measured = left[keep, 0] - right[keep, 0]
+        disparity = self.smoothing * tracks.disparity[keep] + (1 - self.smoothing) * measured
+        return StereoTracks(tracks.ids[keep], left[keep], right[keep], disparity.astype(np.float32), tracks.age[keep] + 1, False)
+
+    def _cells(self, points: ndarray, shape: tuple[int, int]) -> ndarray:
+        """ Grid cell index of every point. """
+        columns = np.clip((points[:, 0] * self.grid[0] / shape[1]).astype(np.int32), 0, self.grid[0] - 1)
+        rows = np.clip((points[:, 1] * self.grid[1] / shape[0]).astype(np.int32), 0, self.grid[1] - 1)
+        return rows * self.grid[0] + columns
+
+    def _needs_keyframe(self, shape: tuple[int, int]) -> bool:
+        if self.tracks is None or len(self.tracks) < self.min_tracks:
+            return True
+        if self.max_keyframe_interval > 0 and self.frames_since_keyframe >= self.max_keyframe_interval:
+            return True
+        occupied = np.bincount(self._cells(self.tracks.left, shape), minlength=self.grid[0] * self.grid[1]) > 0
+        return bool((self._keyframe_cells & ~occupied).any())  # A region that had tracks ran empty
+
+    def _detect(self, left: ndarray, right: ndarray) -> tuple[ndarray, ndarray]:
+        """ New left and right point pairs of a keyframe. """
+        if self.detector == "orb":
+            points_left, points_right, _ = self.matcher.match_rectified(self.matcher.detect(left), self.matcher.detect(right), self.row_tolerance,
+                                                                        self.min_disparity, self.max_disparity)
+            return points_left, points_right
+
+        keypoints = self.fast.detect(left, None)
+        keypoints = sorted(keypoints, key=lambda keypoint: -keypoint.response)[:self.nfeatures]
+        if not keypoints:
+            return np.empty((0, 2), np.float32), np.empty((0, 2), np.float32)
+        points_left = cv2.KeyPoint_convert(keypoints).reshape(-1, 2)
+        points_right, found = self._flow(left, right, points_left)
+        # Flowing back to the left view has to land on the corner again, repeated texture fails this
+        back, found_back = self._flow(right, left, points_right)
+        consistent = np.abs(back - points_left).max(axis=1) <= 1.0
+        valid = found & found_back & consistent & self._stereo_valid(points_left, points_right, left.shape[:2])
+        return points_left[valid], points_right[valid]
+
+    def _keyframe(self, left: ndarray, right: ndarray) -> StereoTracks:
+        """ Detects new features and adds the ones away from the live tracks. """
+        points_left, points_right = self._detect(left, right)
+
+        tracks = self.tracks
+        if tracks is not None and len(tracks) > 0 and len(points_left) > 0:
+            # Grid of the live tracks with min_distance cells, a new point is dropped if its cell or a neighbour is taken
+            cell = self.min_distance
+            taken = set(map(tuple, np.floor(tracks.left / cell).astype(np.int64).tolist()))
+            cells = np.floor(points_left / cell).astype(np.int64)
+            far = np.array([not any((x + dx, y + dy) in taken for dx in (-1, 0, 1) for dy in (-1, 0, 1)) for x, y in cells.tolist()], bool)
+            points_left, points_right = points_left[far], points_right[far]
+
+        ids = np.arange(self.next_id, self.next_id + len(points_left), dtype=np.int64)
+        self.next_id += len(points_left)
+        new = StereoTracks(ids, points_left.astype(np.float32), points_right.astype(np.float32),
+                           (points_left[:, 0] - points_right[:, 0]).astype(np.float32), np.zeros(len(ids), np.int32), True)
+
+        if tracks is not None and len(tracks) > 0:
+            new = StereoTracks(np.concatenate([tracks.ids, new.ids]), np.concatenate([tracks.left, new.left]), np.concatenate([tracks.right, new.right]),
+                               np.concatenate([tracks.disparity, new.disparity]), np.concatenate([tracks.age, new.age]), True)
+
+        self._keyframe_cells = np.bincount(self._cells(new.left, left.shape[:2]), minlength=self.grid[0] * self.grid[1]) > 0
+        return new
+
+
+_default_matchers = {}
+
+
+def default_orb_matcher(nfeatures: int = 1000) -> ORBMatcher:
+    """ Returns the module-level matcher used by `ORB_detector` for the given feature count. """
+    if nfeatures not in _default_matchers:
+        _default_matchers[nfeatures] = ORBMatcher(nfeatures=nfeatures, cache_size=0)
+    return _default_matchers[nfeatures]
@@ -0,0 +1,166 @@
+import asyncio
+import cv2
+import numpy as np
+from numpy import ndarray
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from .depth_engine import StereoDepthEngine
+from .MoSLib import reproject_disparity
+from .utils.profiling_utils import profile
+
+_END = object()  # Stream ended
+_TIMEOUT = object()  # No frame yet, ask again
+
+
+@dataclass
+class DepthFrame:
+    """
+    One processed stereo pair of an `AsyncDepthPipeline`.
+
+    ### Parameters
+        `index: int`:
+            Sequence number of the pair at the source.
+        `timestamp: float`:
+            Capture time of the pair, `time.monotonic()`.
+        `left: ndarray`:
+            Rectified left frame.
+        `disparity: ndarray`:
+            Filtered fixed-point disparity (divide by 16 for pixels). The frame owns it.
+        `points: ndarray | None`:
+            HxWx3 float32 point image if the pipeline has a `Q`, NaN where the disparity isn't positive.
+    """
+
+    index: int
+    timestamp: float
+    left: ndarray
+    disparity: ndarray
+    points: ndarray | None = None
+
+
+class AsyncDepthPipeline:
+    """
+    Asyncio facade of capture, rectification and depth computation. Every blocking call runs on a single
+    worker thread, the event loop only awaits. Results are consumed with `async for`, and only the newest
+    `queue_size` results are kept, so a slow consumer gets fresh frames instead of a backlog.
+
+        async with AsyncDepthPipeline(capture, rectifier=calibration.rectifier((640, 480)), Q=calibration.Q) as pipeline:
+            async for frame in pipeline:
+                ...
+
+    ### Parameters
+        `capture`:
+            Frame source with the `StereoCapture` interface: `read(timeout)` and `ended`.
+        `engine: StereoDepthEngine | None`:
+            Depth engine. A new one with default parameters if not given.
+        `rectifier: StereoRectifier | None`:
+            Rectifies the frames first if given. Frames are expected rectified otherwise.
+        `Q: ndarray | None`:
+            Disparity-to-depth matrix. Frames get a point image if given.
+        `queue_size: int`:
+            Number of processed frames waiting for the consumer at most.
+        `poll_interval: float`:
+            Seconds a `read` waits on the worker before the pipeline checks for cancellation.
+    """
+
+    def __init__(self, capture, engine: StereoDepthEngine | None = None, rectifier=None, Q: ndarray | None = None,
+                 queue_size: int = 1, poll_interval: float = 0.1):
+        self.capture = capture
+        self.engine = engine if engine is not None else StereoDepthEngine()
+        self.rectifier = rectifier
+        self.Q = Q
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+
+        self.dropped = 0  # Processed frames replaced by newer ones before the consumer took them
+        self._executor = None
+        self._queue = None
+        self._producer = None
+        self._closed = False
+
+    def start(self) -> "AsyncDepthPipeline":
+        """ Starts processing on the running event loop. `async for` starts it too. """
+        if self._producer is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AsyncDepthPipeline")
+            self._queue = asyncio.Queue(self.queue_size)
+            self._producer = asyncio.get_running_loop().create_task(self._produce())
+        return self
+
+    async def aclose(self) -> None:
+        """ Stops processing and waits for the worker thread to finish its current frame. """
+        if self._producer is None or self._closed:
+            return
+        self._closed = True
+        self._producer.cancel()
+        try:
+            await self._producer
+        except asyncio.CancelledError:
+            pass
+        # Wakes a consumer waiting in `__anext__`, replacing the oldest frame if the queue is full
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_END)
+        # The worker is a single thread, this runs only after the frame in progress is done
+        await asyncio.get_running_loop().run_in_executor(self._executor, lambda: None)
+        self._executor.shutdown()
+
+    async def __aenter__(self) -> "AsyncDepthPipeline":
+        return self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    def __aiter__(self) -> "AsyncDepthPipeline":
+        return self
+
+    async def __anext__(self) -> DepthFrame:
+        if self._closed:
+            raise StopAsyncIteration
+        self.start()
+        item = await self._queue.get()
+        if item is _END:
+            await self.aclose()
+            raise StopAsyncIteration
+        if isinstance(item, BaseException):
+            await self.aclose()
+            raise item
+        return item
+
+    async def _produce(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                result = await loop.run_in_executor(self._executor, self._process_next)
+                if result is _TIMEOUT:
+                    continue
+                self._offer(result)
+                if result is _END:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:  # Handed to the consumer
+            self._offer(error)
+
+    def _offer(self, item) -> None:
+        """ Queues a result, replacing the oldest waiting frame if the consumer is behind. """
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+    def _process_next(self):
+        """ Reads and processes the next pair. Runs on the worker thread. """
+        frame = self.capture.read(timeout=self.poll_interval)
+        if frame is None:
+            return _END if self.capture.ended else _TIMEOUT
+
+        left, right = frame.left, frame.right
+        if self.rectifier is not None:
+            left, right = self.rectifier.rectify(left, right, np.empty_like(left), np.empty_like(right))
+
+        with profile("grayscale"):
+            gray_left = cv2.cvtColor(left, cv2.COLOR_BGR2GRAY) if left.ndim == 3 else left
+            gray_right = cv2.cvtColor(right, cv2.COLOR_BGR2GRAY) if right.ndim == 3 else right
+
+        disparity = self.engine.compute(gray_left, gray_right, np.empty(gray_left.shape[:2], np.int16))
+        points = reproject_disparity(disparity, self.Q)[0] if self.Q is not None else None
+        return DepthFrame(frame.index, frame.timestamp, left, disparity, points)
@@ -0,0 +1,376 @@
+import time
+import queue
+import pickle
+import traceback
+from abc import ABC, abstractmethod
+import multiprocessing as mp
+import cv2
+import numpy as np
+from numpy import ndarray
+from dataclasses import dataclass, field
+from .utils.shm_utils import SharedFrameRing
+
+_END = None  # Descriptor closing a queue
+_FAILED = "failed"  # Result message of a process that stopped on an exception
+
+
+class Stage(ABC):
+    """
+    Processing step of a `ProcessPipeline`, run in its own process on every frame. Subclasses are pickled to
+    the process, so keep the constructor arguments small and build heavy objects in `setup`.
+    """
+
+    name = "stage"
+
+    def fields(self, size: tuple[int, int]) -> dict:
+        """ Extra shared arrays the stage writes into every slot, as {name: (shape, dtype)}. """
+        return {}
+
+    def setup(self) -> None:
+        """ Called once in the stage process before the first frame. """
+
+    @abstractmethod
+    def process(self, arrays: dict[str, ndarray]) -> object:
+        """ Processes the arrays of a slot. Writes big results into its own fields, returns small picklable ones. """
+
+
+class DepthStage(Stage):
+    """ `StereoDepthEngine` disparity of every frame, written into the shared `disparity` array. """
+
+    name = "depth"
+
+    def __init__(self, config=None):
+        self.config = config
+
+    def fields(self, size: tuple[int, int]) -> dict:
+        return {"disparity": ((size[1], size[0]), "int16")}
+
+    def setup(self) -> None:
+        from .depth_engine import StereoDepthEngine
+        self.engine = StereoDepthEngine(self.config)
+
+    def process(self, arrays: dict[str, ndarray]) -> None:
+        self.engine.compute(arrays["left"], arrays["right"], arrays["disparity"])
+
+
+class MarkerStage(Stage):
+    """ `MarkerTracker` detections of the left view. Returns Nx4x2 corners, N ids and the poses if a camera matrix is given. """
+
+    name = "markers"
+
+    def __init__(self, matrix_coefficients: ndarray | None = None, distortion_coefficients: ndarray | None = None, **kwargs):
+        self.matrix_coefficients = matrix_coefficients
+        self.distortion_coefficients = distortion_coefficients
+        self.kwargs = kwargs
+
+    def setup(self) -> None:
+        from .utils.marker_detection_utils import MarkerTracker
+        self.tracker = MarkerTracker(self.matrix_coefficients, self.distortion_coefficients, **self.kwargs)
+
+    def process(self, arrays: dict[str, ndarray]):
+        return self.tracker.detect(arrays["left"])
+
+
+@dataclass
+class PipelineFrame:
+    """
+    A frame every stage of a `ProcessPipeline` is done with.
+
+    ### Parameters
+        `index: int`:
+            Sequence number of the pair at the source.
+        `timestamp: float`:
+            Capture time of the pair.
+        `arrays: dict[str, ndarray]`:
+            Shared `left`, `right` and stage arrays, like `disparity`. They are views into shared memory,
+            valid until `release` or the next frame of the pipeline. Copy what you need to keep.
+        `results: dict[str, object]`:
+            Returned values of the stages by stage name.
+    """
+
+    index: int
+    timestamp: float
+    arrays: dict
+    results: dict = field(default_factory=dict)
+    _release: object = field(default=None, repr=False)
+
+    def release(self) -> None:
+        """ Gives the slot back to the capture process. """
+        if self._release is not None:
+            self._release()
+            self._release = None
+            self.arrays = {}
+
+
+def _capture_process(capture_factory, calibration_path, size, spec, stage_queues, results, stop, dropped, drop_when_full) -> None:
+    """ Reads, rectifies and converts pairs into free slots, then hands the slot index to every stage. """
+    ring = SharedFrameRing.attach(spec)
+    capture = None
+    try:
+        capture = capture_factory()
+        rectifier = None
+        if calibration_path is not None:
+            from .utils.calibration_store import StereoCalibration
+            rectifier = StereoCalibration.load(calibration_path).rectifier(size)
+
+        while not stop.is_set():
+            frame = capture.read(timeout=0.1)
+            if frame is None:
+                if getattr(capture, "ended", True):
+                    break
+                continue
+
+            slot = ring.acquire(len(stage_queues) + 1)  # Every stage and the consumer hold a reference
+            while slot is None and not drop_when_full and not stop.is_set():  # Recordings wait for the readers
+                time.sleep(0.001)
+                slot = ring.acquire(len(stage_queues) + 1)
+            if slot is None:  # Readers are behind, skip the frame instead of waiting
+                with dropped.get_lock():
+                    dropped.value += 1
+                continue
+
+            left, right = frame.left, frame.right
+            if rectifier is not None:
+                left, right = rectifier.rectify(left, right)
+            arrays = ring.view(slot)
+            for source, target in ((left, arrays["left"]), (right, arrays["right"])):
+                # cvtColor and copyto would write a new array instead of the slot, the stages would see stale pixels
+                if source.shape[:2] != target.shape:
+                    raise ValueError(f"Frame size {source.shape[1]}x{source.shape[0]} doesn't match the pipeline size {size[0]}x{size[1]}")
+                if source.ndim == 3:
+                    cv2.cvtColor(source, cv2.COLOR_BGR2GRAY, dst=target)
+                else:
+                    np.copyto(target, source)
+
+            descriptor = (slot, frame.index, frame.timestamp)
+            for stage_queue in stage_queues:
+                stage_queue.put(descriptor)
+    except Exception as error:  # Raised by the consumer
+        results.put(_failure("capture", error))
+    finally:
+        for stage_queue in stage_queues:
+            stage_queue.put(_END)
+        release = getattr(capture, "release", None)
+        if release is not None:
+            release()
+        ring.close()
+
+
+def _stage_process(stage: Stage, spec, stage_queue, results) -> None:
+    """ Runs a stage on every slot it gets and reports the result. """
+    ring = SharedFrameRing.attach(spec)
+    try:
+        stage.setup()
+        while True:
+            descriptor = stage_queue.get()
+            if descriptor is _END:
+                break
+            slot, index, timestamp = descriptor
+            try:
+                result = stage.process(ring.view(slot))
+            except Exception as error:  # Reported with the frame, the stage keeps running
+                result = error
+            finally:
+                ring.release(slot)
+            results.put((stage.name, slot, index, timestamp, result))
+    except Exception as error:  # Setup failed, raised by the consumer
+        results.put(_failure(stage.name, error))
+        # Keep giving the slots back until the stream ends, so capture never waits on this stage
+        descriptor = stage_queue.get()
+        while descriptor is not _END:
+            ring.release(descriptor[0])
+            descriptor = stage_queue.get()
+    finally:
+        results.put((stage.name, _END))
+        ring.close()
+
+
+def _failure(name: str, error: Exception) -> tuple:
+    """ Failure message of a process, with the traceback as text. Errors that can't be pickled are sent as `RuntimeError`. """
+    text = traceback.format_exc()
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(repr(error))
+    return name, _FAILED, error, text
+
+
+class ProcessPipeline:
+    """
+    Runs capture and every stage in its own process. Frames are written once into a shared memory ring of
+    preallocated slots, the stages map the same slot in parallel, and only (slot, index, timestamp) descriptors
+    and small stage results go through queues. A slot is reused when every stage and the consumer released it,
+    and capture skips frames instead of waiting when no slot is free.
+
+        pipeline = ProcessPipeline(partial(StereoCapture, 0, 1), (640, 480), [DepthStage(), MarkerStage(K, D)])
+        with pipeline:
+            for frame in pipeline:
+                frame.arrays["disparity"], frame.results["markers"]
+
+    The sources and stages are pickled to the new processes, so scripts need an `if __name__ == "__main__":` guard.
+
+    ### Parameters
+        `capture_factory`:
+            Picklable callable creating the frame source in the capture process, e.g. `partial(StereoCapture, 0, 1)`.
+            The source needs `read(timeout)`, and `ended` if reads can time out before the stream ends.
+        `size: tuple[int, int]`:
+            Frame width and height.
+        `stages: list[Stage]`:
+            Stages run on every frame, in parallel.
+        `calibration_path: str | None`:
+            Stereo calibration file. Frames are rectified in the capture process if given.
+        `slots: int`:
+            Number of shared frame slots.
+        `drop_when_full: bool`:
+            Capture skips a frame when every slot is in use, so a live source never builds latency.
+            Otherwise it waits for a free slot, which suits recordings.
+        `context: str`:
+            `multiprocessing` start method. "spawn" is safe with OpenCV's own threads.
+    """
+
+    def __init__(self, capture_factory, size: tuple[int, int], stages: list[Stage], calibration_path: str | None = None,
+                 slots: int = 8, drop_when_full: bool = True, context: str = "spawn"):
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Stage names must be unique: {names}")
+
+        self.capture_factory = capture_factory
+        self.size = (int(size[0]), int(size[1]))
+        self.stages = stages
+        self.calibration_path = calibration_path
+        self.slots = slots
+        self.drop_when_full = drop_when_full
+        self._context = mp.get_context(context)
+
+        self.ring = None
+        self.processes = []
+        self._dropped = None
+        self._pending = {}
+        self._current = None
+        self._ended = set()
+
+    @property
+    def dropped(self) -> int:
+        """ Frames the capture process skipped because every slot was in use. """
+        return self._dropped.value if self._dropped is not None else 0
+
+    def start(self) -> "ProcessPipeline":
+        """ Creates the shared ring and starts the processes. """
+        if self.ring is not None:
+            return self
+
+        fields = {"left": ((self.size[1], self.size[0]), "uint8"), "right": ((self.size[1], self.size[0]), "uint8")}
+        for stage in self.stages:
+            fields.update(stage.fields(self.size))
+        self.ring = SharedFrameRing(fields, self.slots, self._context.Lock())
+
+        self._stop = self._context.Event()
+        self._dropped = self._context.Value("q", 0)
+        self._results = self._context.Queue()
+        # Kept on the pipeline: spawned processes open the queue semaphores after start() returns
+        self._stage_queues = stage_queues = [self._context.Queue() for _ in self.stages]
+
+        spec = self.ring.spec()
+        self.processes = [self._context.Process(target=_stage_process, args=(stage, spec, stage_queue, self._results), daemon=True,
+                                                name=f"MoSLib-{stage.name}") for stage, stage_queue in zip(self.stages, stage_queues)]
+        self.processes.append(self._context.Process(target=_capture_process, daemon=True, name="MoSLib-capture",
+                                                    args=(self.capture_factory, self.calibration_path, self.size, spec, stage_queues,
+                                                          self._results, self._stop, self._dropped, self.drop_when_full)))
+        for process in self.processes:
+            process.start()
+        return self
+
+    def read(self, timeout: float | None = None) -> PipelineFrame | None:
+        """
+        Waits for the next frame every stage is done with. The previous frame is released.
+
+        ### Returns
+            The frame, or `None` at the end of the stream or on timeout.
+
+        ### Raises
+            The exception that stopped the capture process or the setup of a stage, and `RuntimeError`
+            if a stage process exits without finishing the stream.
+        """
+        if self.ring is None:
+            self.start()
+        if self._current is not None:
+            self._current.release()
+            self._current = None
+
+        names = {stage.name for stage in self.stages}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            complete = [index for index, (_, _, results) in self._pending.items() if results.keys() == names]
+            if complete:
+                index = min(complete)
+                slot, timestamp, results = self._pending.pop(index)
+                self._current = PipelineFrame(index, timestamp, self.ring.view(slot), results, lambda slot=slot: self.ring.release(slot))
+                return self._current
+            if self._ended == names:
+                return None
+
+            # A process flushes its results before it exits, so one found dead before an empty get has nothing more to say
+            exited = [(stage.name, process.exitcode) for stage, process in zip(self.stages, self.processes)
+                      if stage.name not in self._ended and not process.is_alive()]
+            try:
+                message = self._results.get(timeout=0.1)
+            except queue.Empty:
+                if exited:
+                    name, exitcode = exited[0]
+                    raise RuntimeError(f"The {name} stage process exited with code {exitcode} before the end of the stream")
+                if timeout is not None and time.monotonic() >= deadline:
+                    return None
+                continue
+            if message[1] is _END:
+                self._ended.add(message[0])
+                continue
+            if message[1] == _FAILED:
+                name, _, error, text = message
+                raise error from RuntimeError(f"In the {name} process:\n{text}")
+            name, slot, index, timestamp, result = message
+            self._pending.setdefault(index, (slot, timestamp, {}))[2][name] = result
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self, timeout: float = 5.0) -> None:
+        """ Stops the processes and frees the shared memory. """
+        if self.ring is None:
+            return
+        if self._current is not None:
+            self._current.release()
+            self._current = None
+
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            # A process exits only after its queued results are flushed, so keep draining them
+            while process.is_alive() and time.monotonic() < deadline:
+                self._drain()
+                process.join(0.05)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        self.ring.close()
+        self.ring = None
+        self._pending = {}
+        self._ended = set()
+
+    def _drain(self) -> None:
+        """ Throws away the waiting stage results. """
+        try:
+            while True:
+                self._results.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __enter__(self) -> "ProcessPipeline":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
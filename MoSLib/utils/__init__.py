@@ -0,0 +1,7 @@
+from .calibration_store import StereoCalibration
+from .rectify_utils import StereoRectifier
+from .capture_utils import StereoCapture, StereoFrame
+from .pointcloud_utils import PointCloudWriter
+from .shm_utils import SharedFrameRing
+from .replay_utils import StereoReplay
+from .profiling_utils import Profiler, enable_profiling, get_profiler, profile
@@ -1,12 +1,13 @@
 import numpy as np
 import cv2
 import glob
+from .chessboard_utils import find_chessboards
 
 # termination criteria
 criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
 
 
-def calibrate(dirpath : str, prefix : str, image_format : str, square_size : float, width : int = 9, height : int = 6):
+def calibrate(dirpath : str, prefix : str, image_format : str, square_size : float, width : int = 9, height : int = 6, workers : int | None = None, max_size : int | None = None, cache_file : str | None = None):
     """ Apply camera calibration operation for images in the given directory path.
     ### !!!IMPORTANT!!!
     Width and height must not be the same value.
@@ -16,7 +17,10 @@ def calibrate(dirpath : str, prefix : str, image_format : str, square_size : flo
     `image_format` : “jpg” or“png”. These formats are supported by OpenCV.\n
     `square_size` : Edge size of one square.\n
     `width` : Number of intersection points of squares in the long side of the calibration board. It is 9 by default if you use the chessboard above.\n
-    `height` : Number of intersection points of squares in the short side of the calibration board. It is 6by default if you use the chessboard above.
+    `height` : Number of intersection points of squares in the short side of the calibration board. It is 6by default if you use the chessboard above.\n
+    `workers` : Number of processes for corner detection. Number of CPUs by default.\n
+    `max_size` : Detect the board on images downscaled to this size first, refine at full resolution only where it is found.\n
+    `cache_file` : Cache detection results in this file, so only new or changed images are detected on the next run.
     """
     # prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(8,6,0)
     objp = np.zeros((height*width, 3), np.float32)
@@ -34,24 +38,16 @@ def calibrate(dirpath : str, prefix : str, image_format : str, square_size : flo
     #Get all images for calibration
     images = glob.glob(dirpath+'/' + prefix + '*.' + image_format)
 
-    for fname in images:
-        img = cv2.imread(fname)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # Find the chess board corners of all images in parallel. Results keep the order of images.
+    results = find_chessboards(images, (width, height), win_size=(11, 11), max_size=max_size, workers=workers, cache=cache_file)
 
-        # Find the chess board corners
-        ret, corners = cv2.findChessboardCorners(gray, (width, height), None)
-
-        # If found, add object points, image points (after refining them)
-        if ret:
+    for corners, image_size in results:
+        # If found, add object points, image points (refined)
+        if corners is not None:
             objpoints.append(objp)
+            imgpoints.append(corners)
 
-            corners2 = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
-            imgpoints.append(corners2)
-
-            # Draw and display the corners
-            img = cv2.drawChessboardCorners(img, (width, height), corners2, ret)
-
-    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
+    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
 
     return ret, mtx, dist, rvecs, tvecs
     
@@ -0,0 +1,251 @@
+import time
+import threading
+from dataclasses import dataclass
+import cv2
+import numpy as np
+from numpy import ndarray
+from .profiling_utils import get_profiler
+
+
+@dataclass
+class StereoFrame:
+    """
+    Left and right frames paired by capture time.
+
+    ### Parameters
+        `left: ndarray`:
+            Left camera frame.
+        `right: ndarray`:
+            Right camera frame.
+        `left_timestamp: float`:
+            `time.monotonic()` of the left grab.
+        `right_timestamp: float`:
+            `time.monotonic()` of the right grab.
+        `index: int`:
+            Sequence number of the left frame.
+    """
+
+    left: ndarray
+    right: ndarray
+    left_timestamp: float
+    right_timestamp: float
+    index: int
+
+    @property
+    def timestamp(self) -> float:
+        """ Mean capture time of the pair. """
+        return (self.left_timestamp + self.right_timestamp) / 2
+
+    @property
+    def skew(self) -> float:
+        """ Capture time difference between the views in seconds. """
+        return abs(self.left_timestamp - self.right_timestamp)
+
+
+class FrameRing:
+    """
+    Bounded ring of preallocated frames written by a single capture thread. The writer decodes into a
+    spare buffer and swaps it into the ring, so readers only hold the lock while copying a frame out.
+
+    ### Parameters
+        `size: int`:
+            Number of frames kept.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.frames = [None] * size
+        self.timestamps = np.full(size, -np.inf)
+        self.count = 0  # Total number of frames written
+        self.ended = False
+        self.condition = threading.Condition()
+
+    def push(self, frame: ndarray, timestamp: float) -> ndarray | None:
+        """ Stores the frame in the oldest slot and returns the buffer it replaces for reuse. """
+        with self.condition:
+            slot = self.count % self.size
+            spare = self.frames[slot]
+            self.frames[slot] = frame
+            self.timestamps[slot] = timestamp
+            self.count += 1
+            self.condition.notify_all()
+        return spare
+
+    def finish(self) -> None:
+        """ Marks the end of the stream and wakes up the readers. """
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    def slot_of(self, index: int) -> int:
+        return index % self.size
+
+    def nearest(self, timestamp: float) -> int | None:
+        """ Slot whose timestamp is nearest to the given one. Must be called with the lock held. """
+        if self.count == 0:
+            return None
+        return int(np.argmin(np.abs(self.timestamps - timestamp)))
+
+    def copy(self, slot: int, out: ndarray | None) -> ndarray:
+        """ Copies a frame out of the ring. Must be called with the lock held. """
+        frame = self.frames[slot]
+        if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+            return frame.copy()
+        np.copyto(out, frame)
+        return out
+
+
+class _CaptureThread(threading.Thread):
+    """ Grabs frames of one device into its ring until stopped or the stream ends. """
+
+    def __init__(self, capture: cv2.VideoCapture, ring: FrameRing):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.ring = ring
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        spare = None
+        while not self.stopped.is_set():
+            if not self.capture.grab():
+                break
+            timestamp = time.monotonic()  # Grab time is the closest we get to the exposure time
+            ok, frame = self.capture.retrieve(spare)
+            if not ok:
+                break
+            spare = self.ring.push(frame, timestamp)
+        self.ring.finish()
+
+
+class StereoCapture:
+    """
+    Synchronized stereo camera source. Every camera is read on its own thread into a ring buffer
+    of frames, and `read` pairs the left frame with the right frame nearest in time.
+
+    ### Parameters
+        `left_source: int | str | cv2.VideoCapture`:
+            Left camera index, device path or an opened capture.
+        `right_source: int | str | cv2.VideoCapture`:
+            Right camera index, device path or an opened capture.
+        `frame_size: tuple[int, int] | None`:
+            Requested width and height of both cameras.
+        `buffer_size: int`:
+            Number of frames kept per camera.
+        `latest_only: bool`:
+            `read` returns the newest pair and skips the older ones, so a slow consumer never
+            builds up a backlog. Otherwise pairs are returned in order until the ring is overrun.
+    """
+
+    def __init__(self, left_source: int | str | cv2.VideoCapture, right_source: int | str | cv2.VideoCapture,
+                 frame_size: tuple[int, int] | None = None, buffer_size: int = 4, latest_only: bool = True):
+        self.captures = [_open(left_source, frame_size), _open(right_source, frame_size)]
+        self.rings = [FrameRing(buffer_size), FrameRing(buffer_size)]
+        self.latest_only = latest_only
+        self.threads = []
+        self.next_index = 0
+        self.dropped = 0  # Left frames never returned by `read`
+
+    def isOpened(self) -> bool:
+        return all(capture.isOpened() for capture in self.captures)
+
+    @property
+    def ended(self) -> bool:
+        """ Whether the left stream ended and every frame of it is read, `read` returns `None` from now on. """
+        left_ring = self.rings[0]
+        with left_ring.condition:
+            return left_ring.ended and left_ring.count <= self.next_index
+
+    def start(self) -> "StereoCapture":
+        """ Starts the capture threads. """
+        if not self.threads:
+            self.threads = [_CaptureThread(capture, ring) for capture, ring in zip(self.captures, self.rings)]
+            for thread in self.threads:
+                thread.start()
+        return self
+
+    def stop(self) -> None:
+        """ Stops the capture threads. """
+        for thread in self.threads:
+            thread.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def release(self) -> None:
+        """ Stops the threads and releases the cameras. """
+        self.stop()
+        for capture in self.captures:
+            capture.release()
+
+    def __enter__(self) -> "StereoCapture":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def read(self, timeout: float | None = 1.0, out_left: ndarray | None = None, out_right: ndarray | None = None) -> StereoFrame | None:
+        """
+        Waits for the next left frame and pairs it with the nearest right frame.
+
+        ### Parameters
+            `timeout: float | None`:
+                Seconds to wait for a new frame. Waits forever if `None`.
+            `out_left, out_right: ndarray | None`:
+                Arrays to copy the frames into. New arrays are returned if not given or mismatched.
+
+        ### Returns
+            The frame pair, or `None` if the stream ended or timed out.
+        """
+        if not self.threads:
+            self.start()
+
+        profiler = get_profiler()
+        start = time.perf_counter_ns() if profiler.enabled else 0
+        left_ring, right_ring = self.rings
+
+        with left_ring.condition:
+            if not left_ring.condition.wait_for(lambda: left_ring.count > self.next_index or left_ring.ended, timeout):
+                return None
+            if left_ring.count <= self.next_index:
+                return None
+
+            if self.latest_only:
+                index = left_ring.count - 1
+            else:
+                index = max(self.next_index, left_ring.count - left_ring.size)  # Oldest frame still in the ring
+            self.dropped += index - self.next_index
+            profiler.drop("capture", index - self.next_index)
+            self.next_index = index + 1
+
+            slot = left_ring.slot_of(index)
+            left_timestamp = float(left_ring.timestamps[slot])
+            left = left_ring.copy(slot, out_left)
+
+        with right_ring.condition:
+            if not right_ring.condition.wait_for(lambda: right_ring.count > 0 or right_ring.ended, timeout):
+                return None
+            slot = right_ring.nearest(left_timestamp)
+            if slot is None:
+                return None
+            right_timestamp = float(right_ring.timestamps[slot])
+            right = right_ring.copy(slot, out_right)
+
+        if profiler.enabled:  # Waiting for the camera included, this is how long the pipeline is blocked on capture
+            profiler.record_ns("capture", start, time.perf_counter_ns())
+        return StereoFrame(left, right, left_timestamp, right_timestamp, index)
+
+
+def _open(source: int | str | cv2.VideoCapture, frame_size: tuple[int, int] | None) -> cv2.VideoCapture:
+    """ Opens the source if needed and applies the frame size. """
+    capture = source if isinstance(source, cv2.VideoCapture) else cv2.VideoCapture(source)
+    if frame_size is not None:
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, frame_size[0])
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_size[1])
+    return capture
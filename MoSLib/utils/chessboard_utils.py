@@ -0,0 +1,136 @@
+import os
+import pickle
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+
+# termination criteria
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+DEFAULT_FLAGS = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE  # findChessboardCorners default
+
+
+def find_chessboard(path : str, pattern_size : tuple[int, int], flags : int = DEFAULT_FLAGS, win_size : tuple[int, int] = (11, 11), max_size : int | None = None):
+    """ Finds and refines the chessboard corners of one image file.
+    ### PARAMETERS
+    `path` : Image path.\n
+    `pattern_size` : Number of inner corners per chessboard row and column.\n
+    `flags` : `cv2.findChessboardCorners` flags.\n
+    `win_size` : Half of the `cv2.cornerSubPix` search window.\n
+    `max_size` : Fast path. If the longer image side is bigger, the board is searched on a copy downscaled to this size\n
+    with `CALIB_CB_FAST_CHECK` first, and corners are refined at full resolution only if a board was found.
+    ### RETURNS
+    Refined corners or `None` if the board isn't found, and the (width, height) of the image.
+    """
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise FileNotFoundError(f"Image couldn't be read: {path}")
+    image_size = gray.shape[::-1]
+
+    scale = 1.0
+    if max_size is not None and max(image_size) > max_size:
+        scale = max_size / max(image_size)
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ret, corners = cv2.findChessboardCorners(small, pattern_size, flags | cv2.CALIB_CB_FAST_CHECK)
+    else:
+        ret, corners = cv2.findChessboardCorners(gray, pattern_size, flags)
+
+    if not ret:
+        return None, image_size
+
+    if scale != 1.0:
+        corners = corners / np.float32(scale)  # Back to full resolution coordinates
+
+    corners = cv2.cornerSubPix(gray, corners, win_size, (-1, -1), criteria)
+    return corners, image_size
+
+
+class CornerCache:
+    """ On-disk cache of chessboard detection results, "not found" included.
+    Entries are keyed by image path, modification time, file size and the detection parameters,
+    so a changed image or different parameters are detected again.
+    ### PARAMETERS
+    `path` : Cache file. It is created on the first `save`.
+    """
+
+    def __init__(self, path : str):
+        self.path = path
+        self.entries = {}
+        self.modified = False
+
+        if os.path.isfile(path):
+            try:
+                with open(path, "rb") as file:
+                    self.entries = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):  # Broken cache, start over
+                self.entries = {}
+
+    @staticmethod
+    def key(path : str, *params) -> tuple:
+        """ Cache key of an image for the given detection parameters. """
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size) + params
+
+    def get(self, key : tuple):
+        return self.entries.get(key)
+
+    def put(self, key : tuple, result) -> None:
+        self.entries[key] = result
+        self.modified = True
+
+    def save(self) -> None:
+        """ Writes the cache if anything is added. """
+        if not self.modified:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self.entries, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+
+def find_chessboards(paths : list[str], pattern_size : tuple[int, int], flags : int = DEFAULT_FLAGS, win_size : tuple[int, int] = (11, 11),
+                     max_size : int | None = None, workers : int | None = None, cache : CornerCache | str | None = None):
+    """ Runs `find_chessboard` for every image on a process pool.
+    ### PARAMETERS
+    `paths` : Image paths.\n
+    `workers` : Number of processes. Number of CPUs by default, 1 runs in this process.\n
+    `cache` : `CornerCache` or its file path. Only new or changed images are detected if given.\n
+    Other parameters are the same with `find_chessboard`.
+    ### RETURNS
+    List of (corners or `None`, image size) in the same order with `paths`.
+    """
+    find = partial(find_chessboard, pattern_size=pattern_size, flags=flags, win_size=win_size, max_size=max_size)
+
+    if isinstance(cache, str):
+        cache = CornerCache(cache)
+
+    results = [None] * len(paths)
+    if cache is not None:
+        keys = [CornerCache.key(path, tuple(pattern_size), flags, tuple(win_size), max_size) for path in paths]
+        results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(missing))
+
+    if workers <= 1:
+        found = [find(paths[i]) for i in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            found = list(executor.map(find, [paths[i] for i in missing], chunksize=max(1, len(missing) // (workers * 4))))
+
+    for i, result in zip(missing, found):
+        results[i] = result
+        if cache is not None:
+            cache.put(keys[i], result)
+
+    if cache is not None:
+        cache.save()
+
+    return results
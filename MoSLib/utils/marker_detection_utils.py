@@ -1,44 +1,220 @@
 import numpy as np
 import cv2
 import cv2.aruco as aruco
+from dataclasses import dataclass
 
 aruco_size = 5 # For 5X5 aruco detection.
-aruco_dict_param = f"aruco.DICT_{aruco_size}X{aruco_size}_250" # If you need fewer markers, use a smaller dictionary. (50, 100, 250, 1000)
+aruco_dict_param = getattr(aruco, f"DICT_{aruco_size}X{aruco_size}_250") # If you need fewer markers, use a smaller dictionary. (50, 100, 250, 1000)
 
-cap = cv2.VideoCapture(0) # Get camera source
 
-def track(matrix_coefficients, distortion_coefficients):
-    """ 
+@dataclass
+class MarkerDetections:
+    """
+    Markers found in one frame.
+
+    ### Parameters
+        `corners: np.ndarray`:
+            Nx4x2 float32 marker corners (top left, top right, bottom right, bottom left).
+        `ids: np.ndarray`:
+            N marker ids.
+        `rvecs: np.ndarray | None`:
+            Nx3 rotation vectors. `None` if the tracker has no camera matrix.
+        `tvecs: np.ndarray | None`:
+            Nx3 translation vectors. `None` if the tracker has no camera matrix.
+        `full_scan: bool`:
+            Whether the whole frame is searched, or only the regions around the last markers.
+    """
+
+    corners: np.ndarray
+    ids: np.ndarray
+    rvecs: np.ndarray | None = None
+    tvecs: np.ndarray | None = None
+    full_scan: bool = True
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class MarkerTracker:
+    """
+    ArUco marker tracker. The dictionary and detector are built once, poses are estimated right after
+    detection and nothing is drawn unless `draw` is called, so it runs headless.
+
+    ### Parameters
+        `matrix_coefficients: np.ndarray | None`:
+            Calibration matrix from the camera calibration process. Poses are skipped if not given.
+        `distortion_coefficients: np.ndarray | None`:
+            Distortion coefficients from the camera calibration process.
+        `marker_length: float`:
+            Edge length of the markers, in the unit of the returned translations.
+        `dictionary: int`:
+            Predefined ArUco dictionary.
+        `roi_margin: float`:
+            ROI mode. If positive, the next frames are searched only near the last markers, this many
+            marker sizes around them. 0 scans the full frame every time.
+        `full_scan_interval: int`:
+            ROI mode. A full frame scan is made at least every this many frames, to find new markers.
+    """
+
+    def __init__(self, matrix_coefficients: np.ndarray | None = None, distortion_coefficients: np.ndarray | None = None,
+                 marker_length: float = 0.02, dictionary: int = aruco_dict_param, roi_margin: float = 0.0, full_scan_interval: int = 10):
+        self.matrix_coefficients = matrix_coefficients
+        self.distortion_coefficients = distortion_coefficients if distortion_coefficients is not None else np.zeros(5)
+        self.marker_length = marker_length
+        self.roi_margin = roi_margin
+        self.full_scan_interval = full_scan_interval
+
+        if hasattr(aruco, "ArucoDetector"):  # OpenCV 4.7+
+            self.dictionary = aruco.getPredefinedDictionary(dictionary)
+            self.parameters = aruco.DetectorParameters()
+            self.detector = aruco.ArucoDetector(self.dictionary, self.parameters)
+        else:
+            self.dictionary = aruco.Dictionary_get(dictionary)
+            self.parameters = aruco.DetectorParameters_create()
+            self.detector = None
+
+        half = marker_length / 2
+        self.object_points = np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], np.float32)
+
+        self.last = None
+        self.frames_since_full_scan = 0
+
+    def _detect(self, gray: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ Detects markers in a grayscale image, returns Nx4x2 corners and N ids. """
+        if self.detector is not None:
+            corners, ids, _ = self.detector.detectMarkers(gray)
+        else:
+            corners, ids, _ = aruco.detectMarkers(gray, self.dictionary, parameters=self.parameters)
+
+        if ids is None or len(ids) == 0:
+            return np.empty((0, 4, 2), np.float32), np.empty(0, np.int32)
+        return np.asarray(corners, np.float32).reshape(-1, 4, 2), ids.reshape(-1).astype(np.int32)
+
+    def _rois(self, shape: tuple[int, int]) -> list[tuple[int, int, int, int]]:
+        """ Search regions around the last markers, overlapping ones merged. """
+        height, width = shape
+        rois = []
+        for corners in self.last.corners:
+            (x0, y0), (x1, y1) = corners.min(axis=0), corners.max(axis=0)
+            margin = self.roi_margin * max(x1 - x0, y1 - y0)
+            rois.append([max(0, int(x0 - margin)), max(0, int(y0 - margin)), min(width, int(x1 + margin) + 1), min(height, int(y1 + margin) + 1)])
+
+        merged = True
+        while merged and len(rois) > 1:
+            merged = False
+            for i in range(len(rois)):
+                for j in range(i + 1, len(rois)):
+                    a, b = rois[i], rois[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rois[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del rois[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return rois
+
+    def detect(self, frame: cv2.Mat | np.ndarray) -> MarkerDetections:
+        """
+        Detects the markers and estimates their poses.
+
+        ### Parameters
+            `frame: cv2.Mat | np.ndarray`:
+                BGR or grayscale Image/Frame.
+
+        ### Returns
+            Detected markers.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame  # Change grayscale
+
+        full_scan = (self.roi_margin <= 0 or self.last is None or len(self.last) == 0
+                     or self.frames_since_full_scan + 1 >= self.full_scan_interval)
+
+        if not full_scan:
+            found_corners, found_ids = [], []
+            for x0, y0, x1, y1 in self._rois(gray.shape[:2]):
+                corners, ids = self._detect(gray[y0:y1, x0:x1])
+                found_corners.append(corners + np.float32((x0, y0)))
+                found_ids.append(ids)
+            corners, ids = np.concatenate(found_corners), np.concatenate(found_ids)
+            if len(ids) == 0:  # Lost them, look at the whole frame
+                full_scan = True
+            else:
+                self.frames_since_full_scan += 1
+
+        if full_scan:
+            corners, ids = self._detect(gray)
+            self.frames_since_full_scan = 0
+
+        rvecs, tvecs = self.estimate_poses(corners)
+        self.last = MarkerDetections(corners, ids, rvecs, tvecs, full_scan)
+        return self.last
+
+    def estimate_poses(self, corners: np.ndarray) -> tuple[np.ndarray | None, np.ndarray | None]:
+        """
+        Estimates the pose of every marker, in one call on OpenCV versions that still have `estimatePoseSingleMarkers`.
+
+        ### Parameters
+            `corners: np.ndarray`:
+                Nx4x2 marker corners.
+
+        ### Returns
+            Nx3 rotation and Nx3 translation vectors, or `None`s without a camera matrix.
+        """
+        if self.matrix_coefficients is None:
+            return None, None
+        if len(corners) == 0:
+            return np.empty((0, 3)), np.empty((0, 3))
+
+        if hasattr(aruco, "estimatePoseSingleMarkers"):  # Before OpenCV 4.7, a single call for all markers
+            rvecs, tvecs, _ = aruco.estimatePoseSingleMarkers(list(corners.reshape(-1, 1, 4, 2)), self.marker_length,
+                                                              self.matrix_coefficients, self.distortion_coefficients)
+            return rvecs.reshape(-1, 3), tvecs.reshape(-1, 3)
+
+        # Same solver the removed call used, one marker at a time. Corners are in the order IPPE_SQUARE expects.
+        rvecs, tvecs = np.empty((len(corners), 3)), np.empty((len(corners), 3))
+        for i, marker in enumerate(corners):
+            _, rvec, tvec = cv2.solvePnP(self.object_points, marker.reshape(4, 1, 2), self.matrix_coefficients,
+                                         self.distortion_coefficients, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            rvecs[i], tvecs[i] = rvec.reshape(3), tvec.reshape(3)
+        return rvecs, tvecs
+
+    def draw(self, frame: cv2.Mat | np.ndarray, detections: MarkerDetections | None = None, axis_length: float = 0.01) -> None:
+        """ Draws squares around the markers and their axes. """
+        detections = detections if detections is not None else self.last
+        if detections is None or len(detections) == 0:
+            return
+
+        aruco.drawDetectedMarkers(frame, list(detections.corners.reshape(-1, 1, 4, 2)), detections.ids.reshape(-1, 1))
+        if detections.rvecs is not None:
+            for rvec, tvec in zip(detections.rvecs, detections.tvecs):
+                cv2.drawFrameAxes(frame, self.matrix_coefficients, self.distortion_coefficients, rvec, tvec, axis_length)
+
+
+def track(matrix_coefficients, distortion_coefficients, source=0):
+    """
     ### PARAMETERS
     `matrix_coefficients` : Calibration matrix from the camera calibration process.\n
-    `distortion_coefficients` : Distortion coefficients from the camera calibration process.
+    `distortion_coefficients` : Distortion coefficients from the camera calibration process.\n
+    `source` : Camera index or video path.
     """
+    cap = cv2.VideoCapture(source) # Get camera source
+    tracker = MarkerTracker(matrix_coefficients, distortion_coefficients)
+
     while True:
         ret, frame = cap.read()
+        if not ret:
+            break
         # operations on the frame come here
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # Change grayscale
-        aruco_dict = aruco.Dictionary_get(aruco_dict_param)  # Use (arcuco_size)X(aruco_size) dictionary to find markers
-        parameters = aruco.DetectorParameters_create()  # Marker detection parameters
-        # lists of ids and the corners beloning to each id
-        corners, ids, rejected_img_points = aruco.detectMarkers(gray, aruco_dict,
-                                                                parameters=parameters,
-                                                                cameraMatrix=matrix_coefficients,
-                                                                distCoeff=distortion_coefficients)
-        if np.all(ids is not None):  # If there are markers found by detector
-            for i in range(0, len(ids)):  # Iterate in markers
-                # Estimate pose of each marker and return the values rvec and tvec---different from camera coefficients
-                rvec, tvec, markerPoints = aruco.estimatePoseSingleMarkers(corners[i], 0.02, matrix_coefficients,
-                                                                           distortion_coefficients)
-                (rvec - tvec).any()  # get rid of that nasty numpy value array error
-                aruco.drawDetectedMarkers(frame, corners)  # Draw A square around the markers
-                aruco.drawAxis(frame, matrix_coefficients, distortion_coefficients, rvec, tvec, 0.01)  # Draw Axis
+        detections = tracker.detect(frame)
+        tracker.draw(frame, detections)  # Draw squares around the markers and their axes
         # Display the resulting frame
         cv2.imshow('frame', frame)
         # Wait 3 milisecoonds for an interaction. Check the key and do the corresponding job.
         key = cv2.waitKey(3) & 0xFF
         if key == ord('q'):  # Quit
             break
-    
+
     # When everything done, release the capture
     cap.release()
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
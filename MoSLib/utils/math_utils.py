@@ -1,5 +1,8 @@
 from math import sqrt, tan, atan, atan2, radians, degrees
+from dataclasses import dataclass, field
+from functools import cached_property
 import cv2
+import numpy as np
 from numpy import ndarray
 
 
@@ -70,8 +73,6 @@ def coordinate_2d(left_cam_pt_angle: float, right_cam_pt_angle: float, c2c_dista
     ### Returns
         2D Coordinate of the point.
     """
-    print("A", left_cam_pt_angle, right_cam_pt_angle)
-
     if is_degrees:
         left_cam_pt_angle = radians(left_cam_pt_angle)
         right_cam_pt_angle = radians(right_cam_pt_angle)
@@ -133,6 +134,191 @@ def point_angles(cam_wh: tuple[int, int], xDepthFactor: float, yDepthFactor: flo
     return x_degree, y_degree # Returned value is from half angle of camera to right or left
 
 
+def _masked_divide(numerator: ndarray, denominator: ndarray) -> ndarray:
+    """ Elementwise float64 division, NaN where the denominator is zero or the result isn't finite. """
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, np.float64), np.asarray(denominator, np.float64))
+    out = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+@dataclass
+class CameraModel:
+    """
+    Vectorized version of the functions above for one camera. Depth factors are computed once,
+    and every method takes arrays of any shape, so all detections of a frame go in one call.
+    Divisions by zero give NaN instead of raising.
+
+    ### Parameters
+        `cam_wh: tuple[int, int]`:
+            Camera width and height in pixels.
+        `angle_width: float`:
+            Horizontal field of view in degrees.
+        `angle_height: float`:
+            Vertical field of view in degrees.
+        `focal_length: float | None`:
+            Focal length in pixels for `distance_monocular`. X depth factor if not given, they are the same for a pinhole camera.
+        `c2c_distance: float | None`:
+            Distance between two cameras, default of `coordinate_2d`.
+        `K: ndarray | None`:
+            Camera matrix from calibration. Pinhole model of the fields of view if not given.
+        `D: ndarray | None`:
+            Distortion coefficients from calibration. `bearings` and `rays` undistort with them.
+    """
+
+    cam_wh: tuple[int, int]
+    angle_width: float
+    angle_height: float
+    focal_length: float | None = None
+    c2c_distance: float | None = None
+    K: ndarray | None = field(default=None, repr=False, compare=False)
+    D: ndarray | None = field(default=None, repr=False, compare=False)
+    xDepthFactor: float = field(init=False)
+    yDepthFactor: float = field(init=False)
+
+    def __post_init__(self):
+        self.xDepthFactor, self.yDepthFactor = depth_factors(self.cam_wh, self.angle_width, self.angle_height)
+        if self.focal_length is None:
+            self.focal_length = self.xDepthFactor
+
+    @classmethod
+    def from_intrinsics(cls, K: ndarray, cam_wh: tuple[int, int], D: ndarray | None = None, c2c_distance: float | None = None) -> "CameraModel":
+        """ Creates the model from a calibration, like the `mtx` and `dist` of `calibration_utils.calibrate`. Fields of view are the ones its focal lengths give. """
+        K = np.asarray(K, np.float64)
+        angle_width = 2 * degrees(atan((cam_wh[0] / 2) / K[0, 0]))
+        angle_height = 2 * degrees(atan((cam_wh[1] / 2) / K[1, 1]))
+        return cls(tuple(cam_wh), angle_width, angle_height, float(K[0, 0]), c2c_distance, K, None if D is None else np.asarray(D, np.float64))
+
+    @property
+    def depth_factors(self) -> tuple[float, float]:
+        return self.xDepthFactor, self.yDepthFactor
+
+    @staticmethod
+    def estimate_focal_length(widthInCm: ndarray, distanceFromCam: ndarray, widthInPixels: ndarray) -> ndarray:
+        """ Vectorized `focal_length`. NaN where `widthInCm` is zero. """
+        return _masked_divide(np.multiply(widthInPixels, distanceFromCam, dtype=np.float64), widthInCm)
+
+    def distance_monocular(self, widthInCm: ndarray, widthInPixels: ndarray) -> ndarray:
+        """ Vectorized `distance_monocular` with the model focal length. NaN where `widthInPixels` is zero. """
+        return _masked_divide(np.multiply(widthInCm, self.focal_length, dtype=np.float64), widthInPixels)
+
+    def point_angles(self, coordinates: ndarray, is_degrees: bool = True) -> ndarray:
+        """
+        Vectorized `point_angles`.
+
+        ### Parameters
+            `coordinates: ndarray`:
+                ...x2 pixel coordinates.
+            `is_degrees: bool`:
+                Return degrees, radians otherwise.
+
+        ### Returns
+            ...x2 horizontal and vertical angles, with the same conventions as `point_angles`.
+        """
+        coordinates = np.asarray(coordinates, np.float64)
+        angles = np.empty(coordinates.shape)
+        np.arctan((coordinates[..., 0] - self.cam_wh[0] / 2) / self.xDepthFactor, out=angles[..., 0])
+        np.arctan((self.cam_wh[1] - coordinates[..., 1]) / self.yDepthFactor, out=angles[..., 1])
+        if is_degrees:
+            np.degrees(angles, out=angles)
+        return angles
+
+    def _normalized_coordinates(self) -> ndarray:
+        """ HxWx2 undistorted normalized image coordinates of every pixel center. """
+        width, height = self.cam_wh
+        K = self.K
+        if K is None:  # Pinhole camera of the depth factors
+            K = np.array([[self.xDepthFactor, 0, width / 2], [0, self.yDepthFactor, height / 2], [0, 0, 1]])
+
+        grid = np.empty((height, width, 2), np.float32)
+        grid[..., 0], grid[..., 1] = np.arange(width, dtype=np.float32)[None, :], np.arange(height, dtype=np.float32)[:, None]
+        if self.D is None:
+            normalized = (grid.reshape(-1, 2) - K[:2, 2]) / (K[0, 0], K[1, 1])
+        else:
+            normalized = cv2.undistortPoints(grid.reshape(-1, 1, 2), K, self.D).reshape(-1, 2)
+        return normalized.reshape(height, width, 2)
+
+    @cached_property
+    def bearing_map(self) -> ndarray:
+        """
+        HxWx2 float32 table of the horizontal and vertical angles in radians of every pixel from the optical axis,
+        lens distortion removed. Built on first use. The principal point is (0, 0), right and up are positive.
+        Unlike `point_angles`, which counts from the image center and the bottom row.
+        """
+        normalized = self._normalized_coordinates()
+        angles = np.empty(normalized.shape, np.float32)
+        np.arctan(normalized[..., 0], out=angles[..., 0])
+        np.arctan(-normalized[..., 1], out=angles[..., 1])  # Image y grows downwards
+        return angles
+
+    @cached_property
+    def ray_map(self) -> ndarray:
+        """ HxWx3 float32 table of the unit viewing ray of every pixel in camera coordinates, lens distortion removed. Built on first use. """
+        normalized = self._normalized_coordinates()
+        rays = np.empty(normalized.shape[:2] + (3,), np.float32)
+        rays[..., :2], rays[..., 2] = normalized, 1
+        rays /= np.linalg.norm(rays, axis=2, keepdims=True)
+        return rays
+
+    def _lookup(self, table: ndarray, coordinates: ndarray) -> ndarray:
+        """ Table values at the nearest pixels of the coordinates, NaN outside of the image. """
+        coordinates = np.rint(np.asarray(coordinates, np.float64))
+        # NaN and far away coordinates are masked before the integer cast, they can't be cast safely
+        inside = ((coordinates[..., 0] >= 0) & (coordinates[..., 0] < self.cam_wh[0]) &
+                  (coordinates[..., 1] >= 0) & (coordinates[..., 1] < self.cam_wh[1]))
+        columns = np.where(inside, coordinates[..., 0], 0).astype(np.intp)
+        rows = np.where(inside, coordinates[..., 1], 0).astype(np.intp)
+
+        values = table[rows, columns]
+        values[~inside] = np.nan
+        return values
+
+    def bearings(self, coordinates: ndarray, is_degrees: bool = True) -> ndarray:
+        """
+        Angles of pixels from the optical axis, looked up from `bearing_map`. Right and up are positive.
+
+        ### Parameters
+            `coordinates: ndarray`:
+                ...x2 pixel coordinates, rounded to the nearest pixel.
+            `is_degrees: bool`:
+                Return degrees, radians otherwise.
+
+        ### Returns
+            ...x2 horizontal and vertical angles. NaN for pixels outside of the image.
+        """
+        angles = self._lookup(self.bearing_map, coordinates)
+        if is_degrees:
+            np.degrees(angles, out=angles)
+        return angles
+
+    def rays(self, coordinates: ndarray) -> ndarray:
+        """ ...x3 unit viewing rays of pixels, looked up from `ray_map`. NaN for pixels outside of the image. """
+        return self._lookup(self.ray_map, coordinates)
+
+    def coordinate_2d(self, left_cam_pt_angle: ndarray, right_cam_pt_angle: ndarray, c2c_distance: float | None = None,
+                      is_degrees: bool = True) -> tuple[ndarray, ndarray]:
+        """
+        Vectorized `coordinate_2d`. Model `c2c_distance` is used if not given.
+
+        ### Returns
+            X and Y arrays. NaN where the angles don't intersect, like a zero angle or parallel rays.
+        """
+        if c2c_distance is None:
+            c2c_distance = self.c2c_distance
+        if c2c_distance is None:
+            raise ValueError("c2c_distance is needed, pass it or set it on the model")
+
+        left, right = np.asarray(left_cam_pt_angle, np.float64), np.asarray(right_cam_pt_angle, np.float64)
+        if is_degrees:
+            left, right = np.radians(left), np.radians(right)
+
+        left_cot = _masked_divide(1, np.tan(left))
+        Y = _masked_divide(c2c_distance, left_cot + _masked_divide(1, np.tan(right)))
+        X = Y * left_cot
+        return X, Y
+
+
 def perspective_projection(rcam_pt: tuple[int, int], lcam_pt: tuple[int, int], fx: float, fy: float, c2c_distance: float, pixel_density: float, focal_length: float, home_point: tuple[int, int]):
     pass
     #x = ((b * (lcam_pt[0] - home_point[0]) / ))
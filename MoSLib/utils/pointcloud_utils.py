@@ -0,0 +1,254 @@
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from numpy import ndarray
+from .profiling_utils import profile, get_profiler
+
+PLY_VERTEX = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+PLY_COLOR_VERTEX = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+
+
+def disparity_to_points(disparity: ndarray, Q: ndarray, color: ndarray | None = None, fixed_point: bool = True,
+                        max_depth: float | None = None) -> tuple[ndarray, ndarray | None]:
+    """
+    Valid 3D points of a disparity map.
+
+    ### Parameters
+        `disparity: ndarray`:
+            HxW disparity map.
+        `Q: ndarray`:
+            Disparity-to-depth matrix from stereo calibration or `reprojection_matrix`.
+        `color: ndarray | None`:
+            HxW or HxWx3 BGR left frame. Points get its colors if given.
+        `fixed_point: bool`:
+            Disparity is SGBM fixed-point (x16). Set False for disparities in pixels.
+        `max_depth: float | None`:
+            Points farther than this, in the unit of `Q`, are dropped.
+
+    ### Returns
+        Nx3 float32 points and Nx3 uint8 RGB colors, or `None` without `color`.
+    """
+    if fixed_point:
+        disparity_px = np.multiply(disparity, 1 / 16, dtype=np.float32)
+    else:
+        disparity_px = np.asarray(disparity, np.float32)
+
+    image = cv2.reprojectImageTo3D(disparity_px, np.asarray(Q, np.float64))
+    valid = disparity_px > 0
+    if max_depth is not None:
+        valid &= np.abs(image[:, :, 2]) <= max_depth
+    points = image[valid]
+
+    colors = None
+    if color is not None:
+        colors = color[valid]
+        if colors.ndim == 1:  # Grayscale
+            colors = np.repeat(colors[:, None], 3, axis=1)
+        else:
+            colors = colors[:, ::-1]  # BGR to RGB
+        colors = np.ascontiguousarray(colors, np.uint8)
+
+    return points, colors
+
+
+def voxel_downsample(points: ndarray, voxel_size: float, colors: ndarray | None = None) -> tuple[ndarray, ndarray | None]:
+    """
+    Replaces the points of every occupied voxel with their centroid, and their colors with the mean color.
+
+    ### Parameters
+        `points: ndarray`:
+            Nx3 points.
+        `voxel_size: float`:
+            Voxel edge length, in the unit of the points.
+        `colors: ndarray | None`:
+            Nx3 uint8 colors of the points.
+
+    ### Returns
+        Mx3 float32 centroids and Mx3 uint8 colors, or `None` without `colors`.
+    """
+    if len(points) == 0:
+        return np.empty((0, 3), np.float32), None if colors is None else np.empty((0, 3), np.uint8)
+
+    cells = np.floor(points / voxel_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # One int64 key per voxel, so a 1D unique groups them
+    dims = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    centroids = np.empty((len(counts), 3), np.float32)
+    for axis in range(3):
+        centroids[:, axis] = np.bincount(inverse, points[:, axis], len(counts)) / counts
+
+    mean_colors = None
+    if colors is not None:
+        mean_colors = np.empty((len(counts), 3), np.uint8)
+        for channel in range(3):
+            mean_colors[:, channel] = np.rint(np.bincount(inverse, colors[:, channel], len(counts)) / counts)
+
+    return centroids, mean_colors
+
+
+def write_ply(path: str, points: ndarray, colors: ndarray | None = None) -> None:
+    """ Writes the points, and their RGB colors if given, as a binary little endian PLY file. """
+    vertices = np.empty(len(points), PLY_VERTEX if colors is None else PLY_COLOR_VERTEX)
+    vertices["x"], vertices["y"], vertices["z"] = points[:, 0], points[:, 1], points[:, 2]
+    properties = "property float x\nproperty float y\nproperty float z\n"
+    if colors is not None:
+        vertices["red"], vertices["green"], vertices["blue"] = colors[:, 0], colors[:, 1], colors[:, 2]
+        properties += "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+
+    header = f"ply\nformat binary_little_endian 1.0\nelement vertex {len(points)}\n{properties}end_header\n"
+    with open(path, "wb") as file:
+        file.write(header.encode("ascii"))
+        file.write(vertices.tobytes())
+
+
+class PointCloudWriter:
+    """
+    Streams point clouds of disparity maps to disk on a background thread. `write` only copies the
+    frame into a bounded queue, reprojection, downsampling and I/O happen on the writer thread,
+    so the capture loop never waits for the disk. Frames are dropped when the queue is full.
+
+    ### Parameters
+        `directory: str`:
+            Output directory. It is created if needed.
+        `Q: ndarray`:
+            Disparity-to-depth matrix from stereo calibration or `reprojection_matrix`.
+        `format: str`:
+            "ply" writes a binary PLY file per frame. "npz" writes chunks of `chunk_frames` frames,
+            with `points`, `colors`, `offsets` (first point of every frame), `indices` and `timestamps` arrays.
+        `voxel_size: float | None`:
+            Voxel grid downsampling if given, in the unit of `Q`.
+        `max_depth: float | None`:
+            Points farther than this are dropped.
+        `fixed_point: bool`:
+            Disparities are SGBM fixed-point (x16).
+        `queue_size: int`:
+            Number of frames waiting for the writer thread at most.
+        `chunk_frames: int`:
+            Frames per npz chunk.
+        `prefix: str`:
+            File name prefix.
+    """
+
+    def __init__(self, directory: str, Q: ndarray, format: str = "ply", voxel_size: float | None = None, max_depth: float | None = None,
+                 fixed_point: bool = True, queue_size: int = 8, chunk_frames: int = 30, prefix: str = "cloud"):
+        if format not in ("ply", "npz"):
+            raise ValueError(f"Unknown point cloud format: {format}")
+
+        self.directory = directory
+        self.Q = np.asarray(Q, np.float64)
+        self.format = format
+        self.voxel_size = voxel_size
+        self.max_depth = max_depth
+        self.fixed_point = fixed_point
+        self.chunk_frames = chunk_frames
+        self.prefix = prefix
+
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0  # Frames not written because the queue was full
+        self.written = 0
+        self.error = None  # Exception that stopped the writer thread
+        self._chunk = []
+        self._chunk_index = 0
+        self._next_index = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, disparity: ndarray, color: ndarray | None = None, timestamp: float | None = None) -> bool:
+        """
+        Queues a frame. The arrays are copied, engine buffers can be passed and reused right after.
+
+        ### Parameters
+            `disparity: ndarray`:
+                HxW disparity map.
+            `color: ndarray | None`:
+                Left frame to color the points with.
+            `timestamp: float | None`:
+                Capture time stored in npz chunks.
+
+        ### Returns
+            Whether the frame is queued. False if it is dropped.
+        """
+        if self.error is not None:
+            raise RuntimeError("Point cloud writer stopped") from self.error
+
+        index = self._next_index
+        self._next_index += 1
+        item = (index, disparity.copy(), None if color is None else color.copy(), timestamp)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            get_profiler().drop("pointcloud")
+            return False
+        return True
+
+    def close(self) -> None:
+        """ Writes the queued frames and the last chunk, then stops the thread. """
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("Point cloud writer stopped") from self.error
+
+    def __enter__(self) -> "PointCloudWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                self._write_frame(*item)
+            self._flush_chunk()
+        except Exception as error:  # Surfaced by the next write or close
+            self.error = error
+
+    def _write_frame(self, index: int, disparity: ndarray, color: ndarray | None, timestamp: float | None) -> None:
+        with profile("pointcloud"):
+            self._write_points(index, disparity, color, timestamp)
+
+    def _write_points(self, index: int, disparity: ndarray, color: ndarray | None, timestamp: float | None) -> None:
+        points, colors = disparity_to_points(disparity, self.Q, color, self.fixed_point, self.max_depth)
+        if self.voxel_size is not None:
+            points, colors = voxel_downsample(points, self.voxel_size, colors)
+
+        if self.format == "ply":
+            path = os.path.join(self.directory, f"{self.prefix}_{index:06d}.ply")
+            write_ply(path, points, colors)
+        else:
+            self._chunk.append((index, points, colors, timestamp))
+            if len(self._chunk) >= self.chunk_frames:
+                self._flush_chunk()
+        self.written += 1
+
+    def _flush_chunk(self) -> None:
+        """ Writes the collected frames as one npz chunk. """
+        if not self._chunk:
+            return
+
+        indices, points, colors, timestamps = zip(*self._chunk)
+        arrays = {
+            "points": np.concatenate(points),
+            "offsets": np.cumsum([0] + [len(p) for p in points[:-1]]),
+            "indices": np.asarray(indices),
+            "timestamps": np.asarray([np.nan if t is None else t for t in timestamps]),
+        }
+        if all(c is not None for c in colors):
+            arrays["colors"] = np.concatenate(colors)
+
+        path = os.path.join(self.directory, f"{self.prefix}_{self._chunk_index:05d}.npz")
+        np.savez(path, **arrays)
+        self._chunk = []
+        self._chunk_index += 1
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import nullcontext
+import cv2
+import numpy as np
+
+_NULL_STAGE = nullcontext()  # Shared by every disabled stage, nothing is allocated
+
+
+class _StageTimer:
+    """ Context manager timing one run of a stage. """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record_ns(self.name, self.start, time.perf_counter_ns())
+
+
+class _StageStats:
+    """ Rolling window of the latencies and end times of one stage. """
+
+    __slots__ = ("durations", "ends", "count", "dropped")
+
+    def __init__(self, window: int):
+        self.durations = [0] * window
+        self.ends = [0] * window
+        self.count = 0
+        self.dropped = 0
+
+
+class Profiler:
+    """
+    Per-stage latency recorder. Stages report with `with profiler.stage("sgbm"):` or `record`, the profiler keeps the last
+    `window` latencies of every stage for p50/p95/p99 and throughput, counts dropped frames and keeps recent events for Chrome tracing.
+    A disabled profiler hands out one shared no-op context, so instrumented code costs a method call.
+
+    ### Parameters
+        `enabled: bool`:
+            Recording on/off.
+        `window: int`:
+            Number of latest runs per stage the statistics are computed from.
+        `trace_events: int`:
+            Number of latest runs kept for `chrome_trace`. 0 keeps none.
+    """
+
+    def __init__(self, enabled: bool = True, window: int = 300, trace_events: int = 10000):
+        self.enabled = enabled
+        self.window = window
+        self.stages = {}
+        self.events = deque(maxlen=trace_events) if trace_events > 0 else None
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        """ Context manager timing a stage. """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def record(self, name: str, seconds: float, end: float | None = None) -> None:
+        """ Records a stage run measured elsewhere. `end` is its `time.perf_counter()`, now if not given. """
+        if not self.enabled:
+            return
+        end_ns = time.perf_counter_ns() if end is None else int(end * 1e9)
+        self.record_ns(name, end_ns - int(seconds * 1e9), end_ns)
+
+    def record_ns(self, name: str, start_ns: int, end_ns: int) -> None:
+        """ Records a stage run from its `time.perf_counter_ns` start and end. """
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = _StageStats(self.window)
+            slot = stats.count % self.window
+            stats.durations[slot] = end_ns - start_ns
+            stats.ends[slot] = end_ns
+            stats.count += 1
+            if self.events is not None:
+                self.events.append((name, start_ns, end_ns - start_ns, threading.get_ident()))
+
+    def drop(self, name: str, count: int = 1) -> None:
+        """ Counts dropped frames of a stage. """
+        if not self.enabled or count <= 0:
+            return
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = _StageStats(self.window)
+            stats.dropped += count
+
+    def reset(self) -> None:
+        """ Forgets every recorded run. """
+        with self._lock:
+            self.stages = {}
+            if self.events is not None:
+                self.events.clear()
+            self.origin = time.perf_counter_ns()
+
+    def stats(self) -> dict:
+        """
+        Statistics of every stage over its window.
+
+        ### Returns
+            {stage: {"count", "dropped", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "throughput"}}.
+            Throughput is runs per second over the window, `None` until a stage ran twice.
+        """
+        with self._lock:
+            snapshot = {name: (list(stats.durations), list(stats.ends), stats.count, stats.dropped) for name, stats in self.stages.items()}
+
+        result = {}
+        for name, (durations, ends, count, dropped) in snapshot.items():
+            filled = min(count, self.window)
+            entry = {"count": count, "dropped": dropped}
+            if filled:
+                ms = np.asarray(durations[:filled], np.float64) / 1e6
+                p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+                entry.update(mean_ms=float(ms.mean()), p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99), max_ms=float(ms.max()))
+                span = max(ends[:filled]) - min(ends[:filled])
+                entry["throughput"] = (filled - 1) * 1e9 / span if filled > 1 and span > 0 else None
+            result[name] = entry
+        return result
+
+    def to_json(self, path: str | None = None) -> str:
+        """ Statistics as JSON text, also written to `path` if given. """
+        text = json.dumps({"window": self.window, "stages": self.stats()}, indent=2)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(text)
+        return text
+
+    def chrome_trace(self, path: str) -> None:
+        """ Writes the kept events in Chrome trace format, open it in chrome://tracing or Perfetto. """
+        with self._lock:
+            events = list(self.events) if self.events is not None else []
+        pid = os.getpid()
+        trace = [{"name": name, "ph": "X", "ts": (start - self.origin) / 1e3, "dur": duration / 1e3, "pid": pid, "tid": tid}
+                 for name, start, duration, tid in events]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+    def draw(self, img: cv2.Mat | np.ndarray, origin: tuple[int, int] = (20, 60), renderer=None, color: tuple = (0, 255, 255)) -> None:
+        """
+        Draws a line of statistics per stage.
+
+        ### Parameters
+            `img: cv2.Mat | np.ndarray`:
+                Image/Frame to draw on. Ignored if `renderer` is given.
+            `origin: tuple[int, int]`:
+                Bottom left of the first line.
+            `renderer: OverlayRenderer | None`:
+                Queues the lines as labels of this renderer instead of drawing.
+            `color: tuple`:
+                Text color.
+        """
+        if not self.enabled:
+            return
+        x, y = origin
+        for name, entry in self.stats().items():
+            if "p50_ms" not in entry:
+                continue
+            throughput = f" {entry['throughput']:.0f}/s" if entry["throughput"] else ""
+            dropped = f" drop {entry['dropped']}" if entry["dropped"] else ""
+            text = f"{name}: {entry['p50_ms']:.1f}/{entry['p95_ms']:.1f}/{entry['p99_ms']:.1f} ms{throughput}{dropped}"
+            if renderer is not None:
+                renderer.text((x, y), text, color, None)
+            else:
+                cv2.putText(img, text, (x, y), cv2.FONT_HERSHEY_PLAIN, 1, color, 1)
+            y += 18
+
+
+_profiler = Profiler(enabled=False)
+
+
+def get_profiler() -> Profiler:
+    """ Returns the module-level profiler MoSLib stages report into. It is disabled until `enable_profiling`. """
+    return _profiler
+
+
+def enable_profiling(enabled: bool = True) -> Profiler:
+    """ Turns the module-level profiler on or off and returns it. """
+    _profiler.enabled = enabled
+    return _profiler
+
+
+def profile(name: str):
+    """ Times a stage on the module-level profiler: `with profile("sgbm"): ...`. A shared no-op context when disabled. """
+    if not _profiler.enabled:
+        return _NULL_STAGE
+    return _StageTimer(_profiler, name)
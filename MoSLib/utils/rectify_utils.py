@@ -0,0 +1,143 @@
+import os
+import hashlib
+import cv2
+import numpy as np
+from numpy import ndarray
+from .calibration_store import StereoCalibration
+from .profiling_utils import profile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "MoSLib", "rectify")
+
+
+class StereoRectifier:
+    """
+    Undistortion and rectification of a stereo pair with maps built once per calibration and frame size.
+    Maps are kept in compact fixed-point `CV_16SC2` form and persisted to `cache_dir`, so a restart
+    loads them instead of running `cv2.initUndistortRectifyMap` again.
+
+    ### Parameters
+        `K1, D1, R1, P1`:
+            Camera matrix, distortion, rectification and projection matrices of the left camera.
+        `K2, D2, R2, P2`:
+            Same matrices of the right camera.
+        `size: tuple[int, int]`:
+            Frame width and height.
+        `cache_dir: str | None`:
+            Directory of the persisted maps. Nothing is written if `None`.
+        `key: str | None`:
+            Calibration identity used in the cache file name. Hash of the matrices if not given.
+        `interpolation: int`:
+            Interpolation of `cv2.remap`.
+    """
+
+    def __init__(self, K1: ndarray, D1: ndarray, R1: ndarray, P1: ndarray, K2: ndarray, D2: ndarray, R2: ndarray, P2: ndarray,
+                 size: tuple[int, int], cache_dir: str | None = DEFAULT_CACHE_DIR, key: str | None = None, interpolation: int = cv2.INTER_LINEAR):
+        self.size = (int(size[0]), int(size[1]))
+        self.interpolation = interpolation
+        self.cache_dir = cache_dir
+
+        if key is None:
+            key = _hash_arrays(K1, D1, R1, P1, K2, D2, R2, P2)
+        self.key = key
+
+        maps = self._load_maps()
+        if maps is None:
+            maps = self._build_maps((K1, D1, R1, P1), (K2, D2, R2, P2))
+            self._save_maps(maps)
+        self.left_maps = maps[0:2]
+        self.right_maps = maps[2:4]
+
+        self.left_rectified = None
+        self.right_rectified = None
+
+    @classmethod
+    def from_file(cls, path: str, size: tuple[int, int], cache_dir: str | None = DEFAULT_CACHE_DIR, **kwargs) -> "StereoRectifier":
+        """
+        Creates the rectifier from a stereo calibration file, `.mcal` or XML saved by `save_stereo_coefficients`.
+        Cache is keyed by the hash of the file, so a new calibration always builds new maps.
+        """
+        with open(path, "rb") as file:
+            key = hashlib.sha1(file.read()).hexdigest()
+
+        calibration = StereoCalibration.load(path)
+        return cls(calibration.K1, calibration.D1, calibration.R1, calibration.P1, calibration.K2, calibration.D2, calibration.R2, calibration.P2,
+                   size, cache_dir=cache_dir, key=key, **kwargs)
+
+    @property
+    def cache_path(self) -> str | None:
+        """ Path of the persisted maps for this calibration and frame size. """
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, f"{self.key}_{self.size[0]}x{self.size[1]}.npz")
+
+    def _build_maps(self, left: tuple, right: tuple) -> tuple[ndarray, ndarray, ndarray, ndarray]:
+        leftMap1, leftMap2 = cv2.initUndistortRectifyMap(*left, self.size, cv2.CV_16SC2)
+        rightMap1, rightMap2 = cv2.initUndistortRectifyMap(*right, self.size, cv2.CV_16SC2)
+        return leftMap1, leftMap2, rightMap1, rightMap2
+
+    def _load_maps(self) -> tuple[ndarray, ndarray, ndarray, ndarray] | None:
+        path = self.cache_path
+        if path is None or not os.path.isfile(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                return data["left_map1"], data["left_map2"], data["right_map1"], data["right_map2"]
+        except (OSError, KeyError, ValueError):  # Broken cache file, build the maps again
+            return None
+
+    def _save_maps(self, maps: tuple[ndarray, ndarray, ndarray, ndarray]) -> None:
+        path = self.cache_path
+        if path is None:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write next to the target and rename, so a concurrent reader never sees half a file.
+        tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, left_map1=maps[0], left_map2=maps[1], right_map1=maps[2], right_map2=maps[3])
+        os.replace(tmp_path, path)
+
+    def rectify(self, left: cv2.Mat | ndarray, right: cv2.Mat | ndarray,
+                out_left: ndarray | None = None, out_right: ndarray | None = None) -> tuple[ndarray, ndarray]:
+        """
+        Undistorts and rectifies both views.
+
+        ### Parameters
+            `left: cv2.Mat | ndarray`:
+                Left camera frame.
+            `right: cv2.Mat | ndarray`:
+                Right camera frame.
+            `out_left, out_right: ndarray | None`:
+                Arrays to write into. Rectifier buffers are used if not given.
+
+        ### Returns
+            Rectified left and right frames. Rectifier buffers are overwritten by the next call.
+        """
+        width, height = self.size
+        for name, frame in (("Left", left), ("Right", right)):
+            if frame.shape[:2] != (height, width):
+                raise ValueError(f"{name} frame size {frame.shape[1]}x{frame.shape[0]} doesn't match the rectifier size {width}x{height}")
+
+        if out_left is None:
+            if self.left_rectified is None or self.left_rectified.shape != left.shape or self.left_rectified.dtype != left.dtype:
+                self.left_rectified = np.empty_like(left)
+            out_left = self.left_rectified
+        if out_right is None:
+            if self.right_rectified is None or self.right_rectified.shape != right.shape or self.right_rectified.dtype != right.dtype:
+                self.right_rectified = np.empty_like(right)
+            out_right = self.right_rectified
+
+        with profile("rectify"):
+            # remap allocates a new array if `out` doesn't fit, so its result is returned, not `out`
+            out_left = cv2.remap(left, *self.left_maps, self.interpolation, dst=out_left, borderMode=cv2.BORDER_CONSTANT)
+            out_right = cv2.remap(right, *self.right_maps, self.interpolation, dst=out_right, borderMode=cv2.BORDER_CONSTANT)
+
+        return out_left, out_right
+
+
+def _hash_arrays(*arrays: ndarray) -> str:
+    """ Hash of the given arrays' contents. """
+    sha = hashlib.sha1()
+    for array in arrays:
+        sha.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return sha.hexdigest()
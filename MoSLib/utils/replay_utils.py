@@ -0,0 +1,293 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+from concurrent import futures
+from concurrent.futures import Future, ThreadPoolExecutor
+import cv2
+import numpy as np
+from numpy import ndarray
+from .capture_utils import StereoFrame
+from .profiling_utils import profile, get_profiler
+
+_PAIR_NAME = re.compile(r"left(\d+)\.(png|jpg|jpeg|bmp|tiff?)$", re.IGNORECASE)
+
+
+def recorded_pairs(directory: str) -> list[tuple[int, str, str]]:
+    """
+    `left{i}` / `right{i}` image pairs of a directory, as saved by `take_stereo_imgs.py`.
+
+    ### Returns
+        (i, left path, right path) of every complete pair, ordered by `i`.
+    """
+    pairs = []
+    for name in os.listdir(directory):
+        match = _PAIR_NAME.match(name)
+        if match is None:
+            continue
+        right = os.path.join(directory, "right" + name[len("left"):])
+        if os.path.isfile(right):
+            pairs.append((int(match.group(1)), os.path.join(directory, name), right))
+    pairs.sort()
+    return pairs
+
+
+class StereoReplay:
+    """
+    Recorded stereo source with the `StereoCapture` interface, so recordings go through the same code as the cameras.
+    Frames are decoded ahead on a thread pool into a bounded prefetch queue. Image directories decode `workers` pairs
+    in parallel, videos decode both views in parallel, each on its own thread. `read` only takes a decoded pair.
+
+        with StereoReplay("recordings/run1") as replay:
+            for frame in replay:
+                ...
+
+    ### Parameters
+        `left_source: str`:
+            Directory of `left{i}.png` / `right{i}.png` pairs, or the left video file.
+        `right_source: str | None`:
+            Right video file, if `left_source` is a video.
+        `realtime: bool`:
+            Paces `read` to the recorded frame times like a live camera. Otherwise frames come as fast as they decode.
+        `speed: float`:
+            Playback speed of real-time mode, 2.0 plays twice as fast.
+        `fps: float | None`:
+            Recorded frame rate, the frame times are `i / fps`. Videos use their own rate if not given,
+            image directories 30 FPS.
+        `latest_only: bool`:
+            In real-time mode, frames that are already late when read are skipped like a slow consumer of a camera would.
+        `workers: int`:
+            Decoding threads of image directories.
+        `prefetch: int`:
+            Number of pairs decoded ahead at most.
+        `flags: int`:
+            `cv2.imread` flags of image directories.
+    """
+
+    def __init__(self, left_source: str, right_source: str | None = None, realtime: bool = False, speed: float = 1.0,
+                 fps: float | None = None, latest_only: bool = True, workers: int = 4, prefetch: int = 8, flags: int = cv2.IMREAD_COLOR):
+        self.realtime = realtime
+        self.speed = speed
+        self.fps = fps
+        self.latest_only = latest_only
+        self.workers = workers
+        self.prefetch = prefetch
+        self.flags = flags
+
+        if right_source is None:
+            if not os.path.isdir(left_source):
+                raise ValueError(f"Not a directory of stereo pairs, pass the right video too: {left_source}")
+            self.pairs = recorded_pairs(left_source)
+            self.captures = []
+        else:
+            self.pairs = None
+            self.captures = [cv2.VideoCapture(left_source), cv2.VideoCapture(right_source)]
+            if self.fps is None:
+                self.fps = self.captures[0].get(cv2.CAP_PROP_FPS) or None
+
+        self.dropped = 0  # Decoded pairs skipped by `read` because they were late
+        self._frames = deque()  # (index, left time, right time, left future, right future) in stream order
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pools = []
+        self._position = 0  # Pairs handed to the prefetch queue, decoding resumes here after `stop`
+        self._origin = None  # time.monotonic() of the stream time 0 in real-time mode
+
+    def isOpened(self) -> bool:
+        if self.pairs is not None:
+            return len(self.pairs) > 0
+        return all(capture.isOpened() for capture in self.captures)
+
+    @property
+    def ended(self) -> bool:
+        """ Whether every frame of the recording is read, `read` returns `None` from now on. """
+        with self._condition:
+            return self._finished and not self._frames
+
+    def start(self) -> "StereoReplay":
+        """ Starts decoding ahead. """
+        if self._thread is None:
+            if self.pairs is not None:
+                self._pools = [ThreadPoolExecutor(self.workers, thread_name_prefix="StereoReplay")]
+            else:  # A video decodes in order, one thread per view
+                self._pools = [ThreadPoolExecutor(1, thread_name_prefix="StereoReplay") for _ in self.captures]
+            self._stopped.clear()
+            self._finished = False
+            self._thread = threading.Thread(target=self._produce, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """ Stops decoding. Pairs decoded so far can still be read. """
+        if self._thread is None:
+            return
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+        for pool in self._pools:
+            pool.shutdown()
+        self._pools = []
+
+    def release(self) -> None:
+        """ Stops decoding and closes the videos. """
+        self.stop()
+        with self._condition:
+            self._frames.clear()
+        for capture in self.captures:
+            capture.release()
+
+    def __enter__(self) -> "StereoReplay":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def __iter__(self):
+        while True:
+            frame = self.read(timeout=None)
+            if frame is None:
+                return
+            yield frame
+
+    def read(self, timeout: float | None = 1.0, out_left: ndarray | None = None, out_right: ndarray | None = None) -> StereoFrame | None:
+        """
+        Takes the next decoded pair, waiting until its recorded time in real-time mode.
+
+        ### Parameters
+            `timeout: float | None`:
+                Seconds to wait for decoding. Waits forever if `None`.
+            `out_left, out_right: ndarray | None`:
+                Arrays to copy the frames into. New arrays are returned if not given or mismatched.
+
+        ### Returns
+            The frame pair with its recorded times in seconds from the start of the recording,
+            or `None` if the recording ended or decoding timed out.
+        """
+        if self._thread is None and not self._finished:
+            self.start()
+
+        profiler = get_profiler()
+        start = time.perf_counter_ns() if profiler.enabled else 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frames or self._finished, timeout):
+                return None
+            if not self._frames:
+                return None
+            item = self._frames.popleft()
+            self._condition.notify_all()  # Room for the decoder
+
+        if self.realtime:
+            item = self._pace(item, profiler)
+        index, left_timestamp, right_timestamp, left_future, right_future = item
+
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            left, right = left_future.result(remaining), right_future.result(remaining)
+        except futures.TimeoutError:  # Still decoding, the pair is read next time
+            with self._condition:
+                self._frames.appendleft(item)
+            return None
+        if left is None or right is None:  # Video ended
+            with self._condition:
+                self._frames.clear()
+                self._finished = True
+            return None
+
+        if profiler.enabled:  # Waiting for decoding or pacing included, like a camera read
+            profiler.record_ns("capture", start, time.perf_counter_ns())
+        return StereoFrame(_copy(left, out_left), _copy(right, out_right), left_timestamp, right_timestamp, index)
+
+    def _pace(self, item: tuple, profiler) -> tuple:
+        """ Skips the pairs already late if asked, then sleeps until the recorded time of the pair. """
+        if self._origin is None:
+            self._origin = time.monotonic() - item[1] / self.speed
+
+        if self.latest_only:
+            with self._condition:
+                while self._frames and self._origin + self._frames[0][1] / self.speed <= time.monotonic():
+                    item = self._frames.popleft()
+                    self.dropped += 1
+                    profiler.drop("capture")
+                self._condition.notify_all()
+
+        delay = self._origin + item[1] / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return item
+
+    def _produce(self) -> None:
+        """ Submits the decoding of every pair in order, blocking while `prefetch` pairs are waiting. """
+        try:
+            for item in self._decode():
+                with self._condition:
+                    self._condition.wait_for(lambda: len(self._frames) < self.prefetch or self._stopped.is_set())
+                    if self._stopped.is_set():
+                        return
+                    self._frames.append(item)
+                    self._position += 1
+                    self._condition.notify_all()
+        except Exception as error:  # Handed to the reader with the next pair
+            failed = Future()
+            failed.set_exception(error)
+            with self._condition:
+                self._frames.append((-1, 0.0, 0.0, failed, failed))
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def _decode(self):
+        """ Yields (index, left time, right time, left future, right future) of every pair. """
+        fps = self.fps or 30.0
+        if self.pairs is not None:
+            pool = self._pools[0]
+            for index, left_path, right_path in self.pairs[self._position:]:
+                timestamp = index / fps
+                yield (index, timestamp, timestamp, pool.submit(_imread, left_path, self.flags), pool.submit(_imread, right_path, self.flags))
+            return
+
+        index = self._position
+        while not self._stopped.is_set():
+            left, right = (pool.submit(_read_video, capture) for pool, capture in zip(self._pools, self.captures))
+            # Both views are decoded before the next pair, so the end of a video stops the stream right away
+            left, right = left.result(), right.result()
+            yield (index, index / fps, index / fps, _done(left), _done(right))
+            if left is None or right is None:
+                return
+            index += 1
+
+
+def _imread(path: str, flags: int) -> ndarray:
+    with profile("decode"):
+        image = cv2.imread(path, flags)
+    if image is None:
+        raise ValueError(f"Can't read image: {path}")
+    return image
+
+
+def _read_video(capture: cv2.VideoCapture) -> ndarray | None:
+    """ Next frame of a video, `None` at the end. """
+    with profile("decode"):
+        ok, frame = capture.read()
+    return frame if ok else None
+
+
+def _done(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _copy(frame: ndarray, out: ndarray | None) -> ndarray:
+    """ Decoded frames are fresh arrays, they are copied only into a matching `out`. """
+    if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+        return frame
+    np.copyto(out, frame)
+    return out
@@ -0,0 +1,104 @@
+from multiprocessing import shared_memory
+import numpy as np
+from numpy import ndarray
+
+
+class SharedFrameRing:
+    """
+    Ring of preallocated frame slots in one `multiprocessing.shared_memory` block. Every slot holds the same named
+    arrays, processes map them as NumPy views, so frames move between processes without pickling or copying.
+    Only slot indices travel through queues. A per-slot reference count, also in shared memory, tells when
+    every reader is done with a slot and the writer can reuse it.
+
+    ### Parameters
+        `fields: dict[str, tuple[tuple[int, ...], str]]`:
+            Array name to (shape, dtype) of every slot, like {"left": ((480, 640), "uint8")}.
+        `slots: int`:
+            Number of slots.
+        `lock`:
+            `multiprocessing.Lock` guarding the reference counts, shared with the attaching processes.
+        `name: str | None`:
+            Name of an existing block to attach to. A new block is created if not given.
+    """
+
+    def __init__(self, fields: dict, slots: int, lock, name: str | None = None):
+        self.fields = {key: (tuple(shape), np.dtype(dtype).str) for key, (shape, dtype) in fields.items()}
+        self.slots = slots
+        self.lock = lock
+
+        # Layout: reference counts, then the slots one after another, every array 64 byte aligned
+        base = _align(slots * np.dtype(np.int32).itemsize)
+        offsets = {}
+        self.slot_bytes = 0
+        for key, (shape, dtype) in self.fields.items():
+            offsets[key] = self.slot_bytes
+            self.slot_bytes += _align(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        size = base + self.slot_bytes * slots
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = _attach(name)
+
+        self.refcounts = np.ndarray(slots, np.int32, self.shm.buf, 0)
+        if self.owner:
+            self.refcounts[:] = 0
+        self._views = [{key: np.ndarray(shape, dtype, self.shm.buf, base + slot * self.slot_bytes + offsets[key])
+                        for key, (shape, dtype) in self.fields.items()} for slot in range(slots)]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def spec(self) -> tuple:
+        """ Picklable description another process passes to `attach`. """
+        return self.fields, self.slots, self.lock, self.shm.name
+
+    @classmethod
+    def attach(cls, spec: tuple) -> "SharedFrameRing":
+        """ Maps the ring of a `spec` in this process. """
+        fields, slots, lock, name = spec
+        return cls(fields, slots, lock, name)
+
+    def view(self, slot: int) -> dict[str, ndarray]:
+        """ Arrays of a slot. They stay valid only while the slot is referenced. """
+        return self._views[slot]
+
+    def acquire(self, references: int) -> int | None:
+        """ Takes a free slot for writing and sets its reference count. `None` if every slot is in use. """
+        with self.lock:
+            free = np.flatnonzero(self.refcounts == 0)
+            if len(free) == 0:
+                return None
+            slot = int(free[0])
+            self.refcounts[slot] = references
+            return slot
+
+    def release(self, slot: int) -> None:
+        """ Drops one reference of a slot, it is reused when none is left. """
+        with self.lock:
+            self.refcounts[slot] -= 1
+
+    def close(self) -> None:
+        """ Unmaps the block, and removes it if this process created it. """
+        self._views = []
+        self.refcounts = None
+        try:
+            self.shm.close()
+        except BufferError:  # Views still held outside, the mapping goes away with them
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def _align(size: int, alignment: int = 64) -> int:
+    return -(-size // alignment) * alignment
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """ Attaches to an existing block, the creating process stays responsible for removing it. """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:  # Older versions register it again, with the resource tracker child processes share with the creator
+        return shared_memory.SharedMemory(name=name)
@@ -4,15 +4,18 @@ import glob
 import argparse
 import sys
 from calibration_store import load_coefficients, save_stereo_coefficients
+from chessboard_utils import find_chessboards
 
 # termination criteria
 criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
 image_size = None
 
 
-def stereo_calibrate(left_file, right_file, left_dir, left_prefix, right_dir, right_prefix, image_format, save_file, square_size, width=9, height=6):
+def stereo_calibrate(left_file, right_file, left_dir, left_prefix, right_dir, right_prefix, image_format, save_file, square_size, width=9, height=6,
+                     workers=None, max_size=None, cache_file=None):
     """ Stereo calibration and rectification """
-    objp, leftp, rightp = load_image_points(left_dir, left_prefix, right_dir, right_prefix, image_format, square_size, width, height)
+    objp, leftp, rightp = load_image_points(left_dir, left_prefix, right_dir, right_prefix, image_format, square_size, width, height,
+                                            workers=workers, max_size=max_size, cache_file=cache_file)
 
     K1, D1 = load_coefficients(left_file)
     K2, D2 = load_coefficients(right_file)
@@ -27,7 +30,10 @@ def stereo_calibrate(left_file, right_file, left_dir, left_prefix, right_dir, ri
     save_stereo_coefficients(save_file, K1, D1, K2, D2, R, T, E, F, R1, R2, P1, P2, Q)
 
 
-def load_image_points(left_dir, left_prefix, right_dir, right_prefix, image_format, square_size, width=9, height=6):
+def load_image_points(left_dir, left_prefix, right_dir, right_prefix, image_format, square_size, width=9, height=6, workers=None, max_size=None, cache_file=None):
+    """ Finds the chessboard corners of the image pairs. Corners are detected on `workers` processes,
+    see `chessboard_utils.find_chessboard` for `max_size`. If `cache_file` is given, detection results
+    are cached there and only new or changed images are detected again. """
     global image_size
     pattern_size = (width, height)  # Chessboard size!
     # prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(8,6,0)
@@ -66,44 +72,30 @@ def load_image_points(left_dir, left_prefix, right_dir, right_prefix, image_form
         print("Right images count: ", len(right_images))
         sys.exit(-1)
 
-    pair_images = zip(left_images, right_images)  # Pair the images for single loop handling
+    # Find the chessboard corners of all images in parallel. Results keep the order of the images, so pairs still hold.
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_FILTER_QUADS
+    results = find_chessboards(left_images + right_images, pattern_size, flags, win_size=(5, 5), max_size=max_size, workers=workers, cache=cache_file)
+    pair_results = zip(left_images, right_images, results[:len(left_images)], results[len(left_images):])  # Pair the results for single loop handling
 
-    # Iterate through the pairs and find chessboard corners. Add them to arrays
+    # Add the corners to arrays
     # If openCV can't find the corners in one image, we discard the pair.
-    for left_im, right_im in pair_images:
-        # Right Object Points
-        right = cv2.imread(right_im)
-        gray_right = cv2.cvtColor(right, cv2.COLOR_BGR2GRAY)
-
-        # Find the chess board corners
-        ret_right, corners_right = cv2.findChessboardCorners(gray_right, pattern_size,
-                                                             cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_FILTER_QUADS)
-
-        # Left Object Points
-        left = cv2.imread(left_im)
-        gray_left = cv2.cvtColor(left, cv2.COLOR_BGR2GRAY)
-
-        # Find the chess board corners
-        ret_left, corners_left = cv2.findChessboardCorners(gray_left, pattern_size,
-                                                           cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_FILTER_QUADS)
-
-        if ret_left and ret_right:  # If both image is okay. Otherwise we explain which pair has a problem and continue
+    for left_im, right_im, (corners_left, _), (corners_right, size_right) in pair_results:
+        if corners_left is not None and corners_right is not None:  # If both image is okay. Otherwise we explain which pair has a problem and continue
             # Object points
             objpoints.append(objp)
             # Right points
-            corners2_right = cv2.cornerSubPix(gray_right, corners_right, (5, 5), (-1, -1), criteria)
-            right_imgpoints.append(corners2_right)
+            right_imgpoints.append(corners_right)
             # Left points
-            corners2_left = cv2.cornerSubPix(gray_left, corners_left, (5, 5), (-1, -1), criteria)
-            left_imgpoints.append(corners2_left)
+            left_imgpoints.append(corners_left)
         else:
             print("Chessboard couldn't detected. Image pair: ", left_im, " and ", right_im)
             continue
 
-    image_size = gray_right.shape  # If you have no acceptable pair, you may have an error here.
+    image_size = size_right  # If you have no acceptable pair, you may have an error here.
     return objpoints, left_imgpoints, right_imgpoints
 
 
 if __name__ == '__main__':
     
-    stereo_calibrate("calibrate/left/left.xml", "calibrate/right/right.xml", "calibrate/left", "calib", "calibrate/right", "calib", "png", "calibrate/stereo_calibration.xml", 0.0252, 9, 6)
\ No newline at end of file
+    stereo_calibrate("calibrate/left/left.xml", "calibrate/right/right.xml", "calibrate/left", "calib", "calibrate/right", "calib", "png", "calibrate/stereo_calibration.xml", 0.0252, 9, 6,
+                     cache_file="calibrate/corner_cache.pkl")
\ No newline at end of file
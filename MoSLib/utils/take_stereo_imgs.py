@@ -3,17 +3,11 @@ import cv2
 import glob
 import argparse
 import sys
+from capture_utils import StereoCapture
 
-# Set the values for your cameras
-capL = cv2.VideoCapture(1)
-capR = cv2.VideoCapture(0)
-
-# Use these if you need high resolution.
-# capL.set(3, 1024) # width
-# capL.set(4, 768) # height
-
-# capR.set(3, 1024) # width
-# capR.set(4, 768) # height
+# Set the values for your cameras. Each camera is read on its own thread and frames are paired by timestamp.
+# Use frame_size=(1024, 768) if you need high resolution.
+cap = StereoCapture(1, 0)
 i = 0
 
 
@@ -25,14 +19,16 @@ def main():
 
     i = int(sys.argv[2])  # Get the start number.
 
+    cap.start()
+
     while True:
-        # Grab and retreive for sync
-        if not (capL.grab() and capR.grab()):
+        # Newest pair, nearest in time
+        frame = cap.read()
+        if frame is None:
             print("No more frames")
             break
 
-        _, leftFrame = capL.retrieve()
-        _, rightFrame = capR.retrieve()
+        leftFrame, rightFrame = frame.left, frame.right
 
         # Use if you need high resolution. If you set the camera for high res, you can pass these.
         # cv2.namedWindow('capL', cv2.WINDOW_NORMAL)
@@ -52,8 +48,7 @@ def main():
             cv2.imwrite(sys.argv[1] + "/right" + str(i) + ".png", rightFrame)
             i += 1
 
-    capL.release()
-    capR.release()
+    cap.release()
     cv2.destroyAllWindows()
 
 
@@ -2,13 +2,16 @@ import numpy as np
 import cv2
 import glob
 from calibration_store import save_coefficients
+from chessboard_utils import find_chessboards
 
 # termination criteria
 criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
 
 
-def calibrate(dirpath, prefix, image_format, square_size, width=9, height=6):
-    """ Apply camera calibration operation for images in the given directory path. """
+def calibrate(dirpath, prefix, image_format, square_size, width=9, height=6, workers=None, max_size=None, cache_file=None):
+    """ Apply camera calibration operation for images in the given directory path.
+    Corners are detected on `workers` processes, see `chessboard_utils.find_chessboard` for `max_size`.
+    Detection results are cached in `cache_file` if given. """
     # prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(8,6,0)
     objp = np.zeros((height*width, 3), np.float32)
     objp[:, :2] = np.mgrid[0:width, 0:height].T.reshape(-1, 2)
@@ -26,45 +29,34 @@ def calibrate(dirpath, prefix, image_format, square_size, width=9, height=6):
     # Get the images
     images = glob.glob(dirpath+'/' + prefix + '*.' + image_format)
 
-    # Iterate through the pairs and find chessboard corners. Add them to arrays
+    # Find chessboard corners of all images in parallel. Add them to arrays
     # If openCV can't find the corners in an image, we discard the image.
-    for fname in images:
-        img = cv2.imread(fname)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # Find the chess board corners
-        ret, corners = cv2.findChessboardCorners(gray, (width, height), None)
-
-        # If found, add object points, image points (after refining them)
-        if ret:
+    for corners, image_size in find_chessboards(images, (width, height), win_size=(11, 11), max_size=max_size, workers=workers, cache=cache_file):
+        # If found, add object points, image points (refined)
+        if corners is not None:
             objpoints.append(objp)
+            imgpoints.append(corners)
 
-            corners2 = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
-            imgpoints.append(corners2)
-
-            # Draw and display the corners
-            # Show the image to see if pattern is found ! imshow function.
-            img = cv2.drawChessboardCorners(img, (width, height), corners2, ret)
-
-    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
+    ret, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
 
     return ret, mtx, dist, rvecs, tvecs
 
-cam1 = "right"
-cam = "left" # left or right
+if __name__ == '__main__':  # Worker processes of the corner detection import this file
+    cam1 = "right"
+    cam = "left" # left or right
 
-ret, mtx, dist, rvecs, tvecs = calibrate(f"images/{cam1}", f"{cam1}", "png", 0.0252, 9 ,6)
+    ret, mtx, dist, rvecs, tvecs = calibrate(f"images/{cam1}", f"{cam1}", "png", 0.0252, 9 ,6)
 
-for i in range(0, 27): # 0 to number of images
-    img = cv2.imread(f'images/{cam1}/{cam1}{i}.png')
-    h, w = img.shape[:2]
-    newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w,h), 1, (w,h))
+    for i in range(0, 27): # 0 to number of images
+        img = cv2.imread(f'images/{cam1}/{cam1}{i}.png')
+        h, w = img.shape[:2]
+        newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w,h), 1, (w,h))
 
-    # undistort
-    dst = cv2.undistort(img, mtx, dist, None, newcameramtx)
-    # crop the image
-    x, y, w, h = roi
-    dst = dst[y:y+h, x:x+w]
-    cv2.imwrite(f'calibrate/{cam1}/calib{i}.png', dst)
+        # undistort
+        dst = cv2.undistort(img, mtx, dist, None, newcameramtx)
+        # crop the image
+        x, y, w, h = roi
+        dst = dst[y:y+h, x:x+w]
+        cv2.imwrite(f'calibrate/{cam1}/calib{i}.png', dst)
 
-save_coefficients(mtx, dist, f"calibrate/{cam}/{cam}.xml")
\ No newline at end of file
+    save_coefficients(mtx, dist, f"calibrate/{cam}/{cam}.xml")
\ No newline at end of file
@@ -1,5 +1,10 @@
 import cv2, numpy as np
+import time
+import queue
+import threading
+from functools import lru_cache
 from numpy import ndarray
+from .profiling_utils import profile, get_profiler
 
 
 def read_classes_from_file(classesFilePath: str) -> tuple[tuple, ndarray]:
@@ -89,8 +94,7 @@ def put_text_box(img: cv2.Mat | np.ndarray, textLocation: tuple[int, int], text:
         None.
     """
 
-    size, _ = cv2.getTextSize(text, font, fontSize, textThickness)
-    textWidth, textHeight = size
+    textWidth, textHeight = text_size(text, font, fontSize, textThickness)
 
     cv2.rectangle(img, (max(0, textLocation[0][0]), max(0, textLocation[0][1])), 
                     (max(0, textLocation[0][0]+textWidth), max(40, textLocation[0][1]-(textHeight*2))), recColor, recThickness)
@@ -149,3 +153,283 @@ def show_camera_center(img: cv2.Mat | np.ndarray, color: tuple[int, int, int]=(2
 
     # Center circle
     cv2.circle(img, (half_width, half_heigth), circle_raidus, color, line_thickness)
+
+
+def draw_match_points(img1: cv2.Mat | np.ndarray, img2: cv2.Mat | np.ndarray, pts1: np.ndarray, pts2: np.ndarray, color: tuple=(255, 0, 255), radius: int=8) -> None:
+    """
+    Marks the matched points on both images. Debug step of the ORB matching, keep it out of the hot path.
+    
+    ### Parameters
+        `img1: cv2.Mat | np.ndarray`:
+            First Image/Frame.
+        `img2: cv2.Mat | np.ndarray`:
+            Second Image/Frame.
+        `pts1: np.ndarray`:
+            Nx2 matched points of the first image.
+        `pts2: np.ndarray`:
+            Nx2 matched points of the second image.
+        `color: tuple`:
+            Color of the points.
+        `radius: int`:
+            Radius of the points.
+    
+    ### Returns
+        None.
+    """
+
+    for img, pts in ((img1, pts1), (img2, pts2)):
+        for x, y in np.asarray(pts, np.int32).reshape(-1, 2):
+            cv2.circle(img, (int(x), int(y)), radius, color, cv2.FILLED)
+
+
+def colorize_depth(depth: np.ndarray, near: float, far: float, colormap: int=cv2.COLORMAP_JET, out: np.ndarray | None=None) -> np.ndarray:
+    """
+    Colorizes a metric depth map with a fixed range, so colors mean the same distance in every frame.
+    Visualization only, keep it out of the compute path.
+    
+    ### Parameters
+        `depth: np.ndarray`:
+            Depth map, float meters or int16 millimeters. NaN and 0 are drawn black.
+        `near: float`:
+            Depth of the first colormap color, in the depth unit.
+        `far: float`:
+            Depth of the last colormap color, in the depth unit.
+        `colormap: int`:
+            OpenCV colormap.
+        `out: np.ndarray | None`:
+            HxWx3 uint8 array to write into.
+    
+    ### Returns
+        BGR image.
+    """
+    scale = 255 / (far - near)
+    levels = np.nan_to_num(np.subtract(depth, near, dtype=np.float32), nan=-1)
+    levels *= -scale  # Near is the hot end of the colormaps
+    levels += 255
+    invalid = ~(depth > 0)
+    levels = np.clip(levels, 0, 255).astype(np.uint8)
+
+    out = cv2.applyColorMap(levels, colormap, dst=out)
+    out[invalid] = 0
+    return out
+
+
+@lru_cache(maxsize=4096)
+def text_size(text: str, font: int=cv2.FONT_HERSHEY_PLAIN, fontSize: float=1, textThickness: int=2) -> tuple[int, int]:
+    """ Cached `cv2.getTextSize` width and height. Labels repeat from frame to frame, so most calls are a dict lookup. """
+    return cv2.getTextSize(text, font, fontSize, textThickness)[0]
+
+
+class OverlayRenderer:
+    """
+    Collects the boxes and labels of a frame and draws them in one pass: a `cv2.polylines` call per color
+    for all boxes and all corners, a `cv2.fillPoly` per color for all label backgrounds, and cached text sizes.
+    Drawing goes onto a separate overlay layer, a copy of the frame, so the frame itself stays clean for processing.
+    A disabled renderer does nothing, so headless runs can keep the calls in place.
+
+    ### Parameters
+        `enabled: bool`:
+            Rendering on/off. Every method returns immediately if off.
+        `threaded: bool`:
+            `show` composites and displays on a background thread, the newest frame wins if it falls behind.
+        `window_name: str`:
+            Window of `show`.
+        `rectangleThickness: int`:
+            Thickness of the bounding boxes.
+        `cornerThickness: int`:
+            Thickness of the corners.
+        `font: int`:
+            Font style of the labels.
+        `fontSize: float`:
+            Size of the labels.
+        `textThickness: int`:
+            Thickness of the labels.
+        `fps_smoothing: float`:
+            Weight of the old value in the exponential moving average of the fps. 0 shows the last frame delta.
+        `show_fps: bool`:
+            Draws the fps counter at the top left.
+    """
+
+    def __init__(self, enabled: bool=True, threaded: bool=False, window_name: str="MoSLib", rectangleThickness: int=2, cornerThickness: int=3,
+                 font: int=cv2.FONT_HERSHEY_PLAIN, fontSize: float=1, textThickness: int=2, fps_smoothing: float=0.9, show_fps: bool=True):
+        self.enabled = enabled
+        self.threaded = threaded
+        self.window_name = window_name
+        self.rectangleThickness = rectangleThickness
+        self.cornerThickness = cornerThickness
+        self.font = font
+        self.fontSize = fontSize
+        self.textThickness = textThickness
+        self.fps_smoothing = fps_smoothing
+        self.show_fps = show_fps
+
+        self.fps = 0.0
+        self.last_key = -1  # Last key pressed in the window, -1 if none
+        self.dropped = 0  # Frames the display thread skipped
+        self.layer = None  # Last composited image
+
+        self._boxes = []
+        self._labels = []
+        self._last_tick = None
+        self._queue = None
+        self._thread = None
+
+    def box(self, bboxCoordinates: tuple[tuple[int, int], tuple[int, int]], bboxColor: tuple=(255,0,255), cornerColor: tuple=(0,255,0),
+            label: str | None=None, textColor: tuple=(255,0,0), recColor: tuple=(0,0,255)) -> None:
+        """ Queues a bounding box with corners like `create_bounding_box`, and a label at its top left like `put_text_box`. """
+        if not self.enabled:
+            return
+        (x0, y0), (x1, y1) = bboxCoordinates
+        self._boxes.append((int(x0), int(y0), int(x1), int(y1), tuple(bboxColor), tuple(cornerColor)))
+        if label is not None:
+            self._labels.append((int(x0), int(y0), label, tuple(textColor), tuple(recColor)))
+
+    def text(self, textLocation: tuple[int, int], text: str, textColor: tuple=(255,0,0), recColor: tuple | None=(0,0,255)) -> None:
+        """ Queues a label whose bottom left is at `textLocation`. No background if `recColor` is `None`. """
+        if not self.enabled:
+            return
+        self._labels.append((int(textLocation[0]), int(textLocation[1]), text, tuple(textColor), None if recColor is None else tuple(recColor)))
+
+    def tick(self, now: float | None=None) -> float:
+        """ Marks a new frame and updates the smoothed fps. """
+        if not self.enabled:
+            return self.fps
+        now = time.perf_counter() if now is None else now
+        if self._last_tick is not None and now > self._last_tick:
+            current = 1 / (now - self._last_tick)
+            self.fps = current if self.fps == 0 else self.fps_smoothing * self.fps + (1 - self.fps_smoothing) * current
+        self._last_tick = now
+        return self.fps
+
+    def clear(self) -> None:
+        """ Drops the queued primitives. """
+        self._boxes = []
+        self._labels = []
+
+    def compose(self, frame: cv2.Mat | np.ndarray, out: np.ndarray | None=None) -> np.ndarray | None:
+        """
+        Draws the queued primitives onto a copy of the frame and clears the queue.
+
+        ### Parameters
+            `frame: cv2.Mat | np.ndarray`:
+                Image/Frame. It is not modified.
+            `out: np.ndarray | None`:
+                Array to composite into. The renderer layer is reused if not given.
+
+        ### Returns
+            Composited image, or `None` if disabled.
+        """
+        if not self.enabled:
+            return None
+        boxes, labels = self._boxes, self._labels
+        self.clear()
+        with profile("drawing"):
+            return self._compose(frame, boxes, labels, self.fps, out)
+
+    def show(self, frame: cv2.Mat | np.ndarray) -> None:
+        """ Composites the queued primitives and shows the result, on the display thread if `threaded`. """
+        if not self.enabled:
+            return
+        boxes, labels = self._boxes, self._labels
+        self.clear()
+
+        if not self.threaded:
+            with profile("drawing"):
+                image = self._compose(frame, boxes, labels, self.fps)
+            cv2.imshow(self.window_name, image)
+            self.last_key = cv2.waitKey(1)
+            return
+
+        if self._thread is None:
+            self._queue = queue.Queue(1)
+            self._thread = threading.Thread(target=self._display, daemon=True)
+            self._thread.start()
+        item = (frame.copy(), boxes, labels, self.fps)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:  # Display is behind, replace the waiting frame
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+                get_profiler().drop("drawing")
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+
+    def close(self) -> None:
+        """ Stops the display thread. """
+        if self._thread is not None:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            cv2.destroyWindow(self.window_name)
+
+    def __enter__(self) -> "OverlayRenderer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _display(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            with profile("drawing"):
+                image = self._compose(*item)
+            cv2.imshow(self.window_name, image)
+            self.last_key = cv2.waitKey(1)
+
+    def _compose(self, frame: np.ndarray, boxes: list, labels: list, fps: float, out: np.ndarray | None=None) -> np.ndarray:
+        if out is None:
+            if self.layer is None or self.layer.shape != frame.shape or self.layer.dtype != frame.dtype:
+                self.layer = np.empty_like(frame)
+            out = self.layer
+        np.copyto(out, frame)
+
+        if boxes:
+            coordinates = np.array([box[:4] for box in boxes], np.int32)
+            x0, y0, x1, y1 = coordinates.T
+            corner = np.minimum((x1 - x0) * 0.2, (y1 - y0) * 0.2).astype(np.int32)
+
+            rectangles = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1), np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1)
+            # Every corner is an L shaped 3 point polyline: end of the horizontal arm, box corner, end of the vertical arm
+            corners = np.empty((len(boxes), 4, 3, 2), np.int32)
+            for i, (cx, cy, dx, dy) in enumerate(((x0, y0, 1, 1), (x1, y0, -1, 1), (x1, y1, -1, -1), (x0, y1, 1, -1))):
+                corners[:, i, 0, 0], corners[:, i, 0, 1] = cx + dx * corner, cy
+                corners[:, i, 1, 0], corners[:, i, 1, 1] = cx, cy
+                corners[:, i, 2, 0], corners[:, i, 2, 1] = cx, cy + dy * corner
+
+            for color, indices in _group([box[4] for box in boxes]).items():
+                cv2.polylines(out, list(rectangles[indices]), True, color, self.rectangleThickness)
+            for color, indices in _group([box[5] for box in boxes]).items():
+                cv2.polylines(out, list(corners[indices].reshape(-1, 3, 2)), False, color, self.cornerThickness)
+
+        if self.show_fps:
+            labels = labels + [(20, 30, f"FPS: {int(fps)}", (255, 0, 0), None)]
+        if labels:
+            backgrounds = {}
+            for x, y, text, _, recColor in labels:
+                if recColor is not None:
+                    width, height = text_size(text, self.font, self.fontSize, self.textThickness)
+                    top = max(0, y - 2 * height)
+                    backgrounds.setdefault(recColor, []).append(np.array([[x, top], [x + width, top], [x + width, y], [x, y]], np.int32))
+            for color, polygons in backgrounds.items():
+                cv2.fillPoly(out, polygons, color)
+            for x, y, text, textColor, recColor in labels:
+                height = text_size(text, self.font, self.fontSize, self.textThickness)[1]
+                cv2.putText(out, text, (x, y - (height // 2 if recColor is not None else 0)), self.font, self.fontSize, textColor, self.textThickness)
+
+        return out
+
+
+def _group(colors: list) -> dict:
+    """ Indices of every distinct color. """
+    groups = {}
+    for i, color in enumerate(colors):
+        groups.setdefault(color, []).append(i)
+    return groups
@@ -0,0 +1,224 @@
+"""
+Synthetic stereo benchmarks of MoSLib. Needs no cameras, runs headless.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --resolutions 640x480 --frames 50 --only depth_map
+    python benchmarks/run_benchmarks.py --resolutions 1280x720 --only parallel_depth --threads 1 2 4 8 16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MoSLib
+from MoSLib.depth_engine import DepthConfig, StereoDepthEngine
+from synthetic import RESOLUTIONS, stereo_pair
+
+# Q of the synthetic rig, same values with example.py
+FOCAL_LENGTH = 1530.0
+BASELINE = 15
+
+
+class StageTimer:
+    """ Collects per-stage latencies in seconds. """
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def timed(self, stage: str, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.add(stage, time.perf_counter() - start)
+        return result
+
+    def report(self) -> dict:
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.asarray(samples) * 1000
+            stages[stage] = {
+                "count": len(ms),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p90_ms": float(np.percentile(ms, 90)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return stages
+
+
+def disparity_error(disparity: np.ndarray, ground_truth: np.ndarray, border: int) -> dict:
+    """ Error of a fixed-point disparity against the ground truth, ignoring the left border SGBM can't match. """
+    estimate = disparity.astype(np.float32) / 16
+    region = np.zeros(ground_truth.shape, bool)
+    region[:, border:] = True
+    valid = region & (estimate > 0)
+    error = np.abs(estimate - ground_truth)[valid]
+    return {
+        "valid_fraction": float(valid.sum() / max(1, region.sum())),
+        "mae_px": float(error.mean()) if error.size else None,
+        "median_error_px": float(np.median(error)) if error.size else None,
+        "bad_1px": float((error > 1).mean()) if error.size else None,
+    }
+
+
+def measure(run, frames: int, warmup: int) -> tuple[StageTimer, float, int]:
+    """ Runs `run(timer)` `frames` times after warmup, returns the timer, total seconds and traced peak bytes. """
+    for _ in range(warmup):
+        run(StageTimer())
+
+    timer = StageTimer()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(frames):
+        run(timer)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timer, total, peak
+
+
+def bench_depth_map(left, right, ground_truth, frames, warmup) -> dict:
+    engine = StereoDepthEngine()
+    engine.compute(left, right)  # Allocates the engine buffers the stages below write into
+
+    def run(timer):
+        timer.timed("sgbm_left", engine.left_matcher.compute, left, right, engine.disparity_left)
+        timer.timed("sgbm_right", engine.right_matcher.compute, right, left, engine.disparity_right)
+        timer.timed("wls", engine.wls_filter.filter, engine.disparity_left, left, engine.disparity, engine.disparity_right, right_view=right)
+        timer.timed("normalize", engine.normalize)
+        timer.timed("depth_map", MoSLib.depth_map, left, right)
+
+    timer, total, peak = measure(run, frames, warmup)
+    report = timer.report()
+    return {
+        "fps": frames / sum(timer.samples["depth_map"]),
+        "stages": report,
+        "wall_s": total,
+        "traced_peak_bytes": peak,
+        "error": disparity_error(engine.disparity, ground_truth, engine.config.min_disparity + engine.config.num_disparities),
+    }
+
+
+def bench_parallel_depth(left, right, ground_truth, frames, warmup, threads: list[int]) -> dict:
+    """ Strip-parallel `StereoDepthEngine.compute` with every thread count, speedup against one thread. """
+    scaling = {}
+    for count in threads:
+        with StereoDepthEngine(DepthConfig(threads=count)) as engine:
+            timer, total, peak = measure(lambda timer: timer.timed("compute", engine.compute, left, right), frames, warmup)
+            error = disparity_error(engine.disparity, ground_truth, engine.config.min_disparity + engine.config.num_disparities)
+        report = timer.report()
+        scaling[str(count)] = {"fps": frames / sum(timer.samples["compute"]), "stages": report, "wall_s": total, "error": error}
+
+    base = scaling[str(threads[0])]["fps"]
+    for result in scaling.values():
+        result["speedup"] = result["fps"] / base
+    return scaling
+
+
+def bench_orb(left, right, frames, warmup) -> dict:
+    matcher = MoSLib.ORBMatcher()
+    matches = []
+
+    def run(timer):
+        features_left = timer.timed("detect_left", matcher.detect, left)
+        features_right = timer.timed("detect_right", matcher.detect, right)
+        timer.timed("match", matcher.match, features_left, features_right)
+        matches.append(len(timer.timed("ORB_detector", MoSLib.ORB_detector, left, right)[0]))
+
+    timer, total, peak = measure(run, frames, warmup)
+    return {
+        "fps": frames / sum(timer.samples["ORB_detector"]),
+        "stages": timer.report(),
+        "wall_s": total,
+        "traced_peak_bytes": peak,
+        "matches": int(np.median(matches)),
+    }
+
+
+def bench_projection(left, right, frames, warmup, points: int = 1000) -> dict:
+    height, width = left.shape[:2]
+    rng = np.random.default_rng(0)
+    lcam_pts = rng.random((points, 2), np.float32) * np.float32((width, height))
+    rcam_pts = lcam_pts - np.float32((8, 0))
+    Q = MoSLib.reprojection_matrix((width / 2, height / 2), FOCAL_LENGTH, BASELINE)
+    disparity = np.full((height, width), 8 * 16, np.int16)
+
+    def run(timer):
+        start = time.perf_counter()
+        for lcam_pt, rcam_pt in zip(lcam_pts.tolist(), rcam_pts.tolist()):
+            MoSLib.perspective_projection(rcam_pt, lcam_pt, (width / 2, height / 2), FOCAL_LENGTH, BASELINE, lcam_pt[0] - rcam_pt[0])
+        timer.add("perspective_projection_loop", time.perf_counter() - start)
+        timer.timed("triangulate_points", MoSLib.triangulate_points, lcam_pts, rcam_pts, Q)
+        timer.timed("reproject_disparity", MoSLib.reproject_disparity, disparity, Q)
+
+    timer, total, peak = measure(run, frames, warmup)
+    return {"points": points, "stages": timer.report(), "wall_s": total, "traced_peak_bytes": peak}
+
+
+BENCHMARKS = ("depth_map", "parallel_depth", "ORB_detector", "perspective_projection")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", nargs="+", default=[f"{w}x{h}" for w, h in RESOLUTIONS], help="WIDTHxHEIGHT list")
+    parser.add_argument("--scenes", nargs="+", default=["random_dot", "textured"], choices=["random_dot", "textured"])
+    parser.add_argument("--only", nargs="+", default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8, 16], help="thread counts of parallel_depth, on the default DepthConfig (coarse-to-fine mode ignores threads)")
+    parser.add_argument("--output", default=None, help="JSON result path, stdout if not given")
+    args = parser.parse_args()
+
+    results = {
+        "moslib_benchmark": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "opencv_threads": cv2.getNumThreads(),
+        "runs": [],
+    }
+
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.lower().split("x"))
+        for scene in args.scenes:
+            left, right, ground_truth = stereo_pair(width, height, scene)
+            run = {"resolution": [width, height], "scene": scene}
+            if "depth_map" in args.only:
+                run["depth_map"] = bench_depth_map(left, right, ground_truth, args.frames, args.warmup)
+            if "parallel_depth" in args.only:
+                run["parallel_depth"] = bench_parallel_depth(left, right, ground_truth, args.frames, args.warmup, args.threads)
+            if "ORB_detector" in args.only:
+                run["ORB_detector"] = bench_orb(left, right, args.frames, args.warmup)
+            if "perspective_projection" in args.only:
+                run["perspective_projection"] = bench_projection(left, right, args.frames, args.warmup)
+            results["runs"].append(run)
+            print(f"{width}x{height} {scene} done", file=sys.stderr)
+
+    # ru_maxrss is KiB on Linux, includes OpenCV allocations tracemalloc can't see
+    results["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+RESOLUTIONS = ((320, 240), (640, 480), (1280, 720), (1920, 1080))
+
+
+def texture(width: int, height: int, kind: str = "textured", seed: int = 0) -> np.ndarray:
+    """
+    Creates a uint8 texture for synthetic stereo.
+
+    ### Parameters
+        `kind: str`:
+            "random_dot" for binary random dots, "textured" for multi-scale smoothed noise.
+        `seed: int`:
+            Random seed, same seed gives the same texture.
+
+    ### Returns
+        HxW uint8 texture.
+    """
+    rng = np.random.default_rng(seed)
+    if kind == "random_dot":
+        return (rng.random((height, width)) < 0.5).astype(np.uint8) * 255
+
+    img = np.zeros((height, width), np.float32)
+    for scale in (1, 4, 16):
+        noise = rng.random((max(1, height // scale), max(1, width // scale)), dtype=np.float32)
+        img += cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC) / scale
+    return cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+
+def plane_disparity(width: int, height: int, max_disparity: float) -> np.ndarray:
+    """
+    Ground truth disparity of a slanted background plane with two fronto-parallel planes in front of it.
+
+    ### Returns
+        HxW float32 disparity in pixels. Disparities stay below `max_disparity` at every resolution.
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    disparity = (0.15 * max_disparity + 0.1 * max_disparity * y / height) * np.ones_like(x)  # Floor-like slanted plane
+
+    disparity[height // 4:height // 2, width // 5:width // 2] = 0.5 * max_disparity
+    disparity[height // 2:3 * height // 4, 3 * width // 5:4 * width // 5] = 0.8 * max_disparity
+    return disparity
+
+
+def stereo_pair(width: int, height: int, kind: str = "textured", max_disparity: float = 64, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Creates a rectified stereo pair with known disparity. The right view is the texture, the left view
+    samples it at `x - disparity`, so `left(x, y) == right(x - d(x, y), y)`.
+
+    ### Returns
+        Left image, right image and the float32 ground truth disparity of the left view.
+    """
+    right = texture(width, height, kind, seed)
+    disparity = plane_disparity(width, height, max_disparity)
+
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    left = cv2.remap(right, x - disparity, y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+    return left, right, disparity
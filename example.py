@@ -1,4 +1,5 @@
 import MoSLib
+from MoSLib.utils import StereoCapture
 import math
 import cv2
 import time
@@ -7,23 +8,22 @@ vertical_angle = 64.0
 horizontal_angle = 78.0
 c2c_distance = 15
 
-lcam = cv2.VideoCapture()
-lcam.open("/dev/v4l/by-id/usb-046d_081b_852B89E0-video-index0")
-lcam.set(3, 1280)
-lcam.set(4, 720)
+# Both cameras are read on their own threads, frames are paired by timestamp.
+cams = StereoCapture("/dev/v4l/by-id/usb-046d_081b_852B89E0-video-index0",
+                     "/dev/v4l/by-id/usb-046d_081b_A625B8D0-video-index0", frame_size=(1280, 720)).start()
 
-rcam = cv2.VideoCapture()
-rcam.open("/dev/v4l/by-id/usb-046d_081b_A625B8D0-video-index0")
-rcam.set(3, 1280)
-rcam.set(4, 720)
+# Features are detected on keyframes only and followed with optical flow in between
+tracker = MoSLib.FeatureTracker(min_tracks=100)
 
 previousTime = 0
 
 while True:
     cTime = time.time()
 
-    success1, frame_rcam = lcam.read()
-    success2, frame_lcam = rcam.read()
+    frame = cams.read()
+    if frame is None:
+        break
+    frame_rcam, frame_lcam = frame.left, frame.right
 
     # frame_rcam = cv2.flip(frame_rcam, 0)
     # frame_rcam = cv2.flip(frame_rcam, 1)
@@ -31,15 +31,11 @@ while True:
     frame_lcam = cv2.cvtColor(frame_lcam, cv2.COLOR_BGR2GRAY)
     frame_rcam = cv2.cvtColor(frame_rcam, cv2.COLOR_BGR2GRAY)
 
-    match_pts = MoSLib.ORB_detector(frame_rcam, frame_lcam)
+    tracks = tracker.update(frame_rcam, frame_lcam)
 
-    for match in match_pts:
-        disparity = MoSLib.find_disparity(match[1], match[0])
-        try:
-            x, y, z = MoSLib.perspective_projection(match[0], match[1], (640, 360), 1530.0, c2c_distance, disparity)
-        except:
-            print("Cannot unpack non-iterable NoneType object")
-        print(match[0], z)
+    # Depth of every track, smoothed over the frames it is tracked. NaN without a positive disparity.
+    for track_id, pt, z in zip(tracks.ids, tracks.left, tracks.depth(1530.0, c2c_distance)):
+        print(track_id, pt, z)
 
     MoSLib.visual_utils.fps_counter(frame_lcam, cTime, previousTime)
     previousTime = cTime
@@ -50,6 +46,5 @@ while True:
     if cv2.waitKey(1) & 0xFF == ord("q"):
         break
 
-lcam.release()
-rcam.release()
+cams.release()
 cv2.destroyAllWindows()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests run from a checkout: the package and the synthetic stereo generator of the benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
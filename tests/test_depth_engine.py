@@ -0,0 +1,34 @@
+import math
+from synthetic import stereo_pair
+from MoSLib.depth_engine import StereoDepthEngine
+
+
+def _engine() -> StereoDepthEngine:
+    engine = StereoDepthEngine()
+    engine.focal_length, engine.baseline = 500.0, 0.1
+    return engine
+
+
+def test_measure_boxes_at_the_left_edge():
+    left, right, _ = stereo_pair(640, 480, "textured")
+    engine = _engine()
+
+    # Used to crop narrower than the search range and make SGBM fail
+    for box in (((0, 0), (10, 10)), ((20, 100), (40, 120))):
+        result, = engine.measure_boxes(left, right, [box])
+        assert result.box == box
+        assert math.isnan(result.distance) or result.distance > 0
+
+
+def test_measure_boxes_narrower_frame_than_search_range():
+    left, right, _ = stereo_pair(640, 480, "textured")
+    result, = _engine().measure_boxes(left[:, :50], right[:, :50], [((0, 0), (10, 10))])
+    assert math.isnan(result.distance)
+    assert result.valid_fraction == 0.0
+
+
+def test_measure_boxes_inside_the_frame():
+    left, right, _ = stereo_pair(640, 480, "textured")
+    result, = _engine().measure_boxes(left, right, [((300, 200), (340, 240))])
+    assert result.valid_fraction > 0.5
+    assert result.distance > 0